@@ -1,15 +1,14 @@
 import streamlit as st
-from pymongo import MongoClient
 import yaml
 from yaml.loader import SafeLoader
 import streamlit_authenticator as stauth
+from database import get_database
 
 # --- Streamlit Page Setup ---
 st.set_page_config(layout="wide")
 
 # --- MongoDB Client ---
-client = MongoClient("localhost", 27017)
-db = client["credentials"]
+db = get_database("credentials")
 
 # --- Load Configuration ---
 CONFIG_FILE = "credential.yml"
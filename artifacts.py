@@ -0,0 +1,148 @@
+# Standard Library Imports
+import glob
+import os
+import shutil
+
+# Third-Party Library Imports
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Local Imports
+from config import ARTIFACT_DIR, ARTIFACT_ROW_GROUP_SIZE
+
+# Columnar layout of a file's records: type_id is dictionary-encoded, the
+# timestamp is an int64 microsecond count and the decoded Msg fields are kept
+# as a showname -> value map.
+ARTIFACT_SCHEMA = pa.schema(
+    [
+        ("type_id", pa.dictionary(pa.int32(), pa.string())),
+        ("timestamp", pa.timestamp("us")),
+        ("order", pa.int64()),
+        ("Msg", pa.map_(pa.string(), pa.string())),
+    ]
+)
+
+
+def artifact_path(data_id) -> str:
+    """
+    Returns the artifact directory of a stored log. It is named after the
+    GridFS id of the raw log, so renaming the file does not move it.
+    """
+    return os.path.join(ARTIFACT_DIR, str(data_id))
+
+
+def has_artifact(data_id) -> bool:
+    """
+    Returns whether a columnar artifact exists for a stored log.
+    """
+    return bool(glob.glob(os.path.join(artifact_path(data_id), "part-*.parquet")))
+
+
+def remove_artifact(data_id) -> None:
+    """
+    Deletes the artifact of a stored log, if any.
+    """
+    shutil.rmtree(artifact_path(data_id), ignore_errors=True)
+
+
+class ArtifactWriter:
+    """
+    Writes records into a Parquet part file of an artifact directory, one row
+    group every ``row_group_size`` records.
+
+    The part is written under a name that readers skip and only takes its
+    place once it is closed, so an interrupted write never shows up in the
+    artifact. Parts are numbered in sequence unless ``part`` names one, in
+    which case writing it again replaces it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        row_group_size: int = ARTIFACT_ROW_GROUP_SIZE,
+        part: int = None,
+    ):
+        os.makedirs(path, exist_ok=True)
+        if part is None:
+            part = len(glob.glob(os.path.join(path, "part-*.parquet")))
+        self.path = path
+        self.part_path = os.path.join(path, f"part-{part:05d}.parquet")
+        # Parquet readers skip files starting with an underscore
+        self._write_path = os.path.join(path, f"_part-{part:05d}.parquet")
+        self.row_group_size = row_group_size
+        self._writer = pq.ParquetWriter(self._write_path, ARTIFACT_SCHEMA)
+        self._columns = {name: [] for name in ARTIFACT_SCHEMA.names}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, record: dict) -> None:
+        """
+        Adds a normalized record to the current row group.
+        """
+        self._columns["type_id"].append(record["type_id"])
+        self._columns["timestamp"].append(record["timestamp"])
+        self._columns["order"].append(record["order"])
+        msg = record.get("Msg")
+        self._columns["Msg"].append(list(msg.items()) if msg is not None else None)
+        if len(self._columns["order"]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes the buffered records as a row group.
+        """
+        if not self._columns["order"]:
+            return
+        table = pa.Table.from_pydict(self._columns, schema=ARTIFACT_SCHEMA)
+        self._writer.write_table(table)
+        self._columns = {name: [] for name in ARTIFACT_SCHEMA.names}
+
+    def close(self) -> None:
+        """
+        Flushes the remaining records and adds the part file to the artifact.
+        """
+        self.flush()
+        self._writer.close()
+        os.replace(self._write_path, self.part_path)
+
+    def discard(self) -> None:
+        """
+        Closes the part file without adding it to the artifact.
+        """
+        self._writer.close()
+        os.remove(self._write_path)
+
+
+def artifact_filters(type_ids: list, start_date, end_date) -> list:
+    """
+    Translates the Display tab filters into Parquet row filters.
+    """
+    filters = [("timestamp", ">=", start_date), ("timestamp", "<", end_date)]
+    if type_ids:
+        filters.append(("type_id", "in", list(type_ids)))
+    return filters
+
+
+def read_artifact(data_id, columns: list = None, filters: list = None) -> pa.Table:
+    """
+    Reads an artifact through memory-mapped files.
+
+    Args:
+        data_id: The GridFS id of the stored log.
+        columns (list): The columns to read, all by default.
+        filters (list): Parquet row filters.
+
+    Returns:
+        pa.Table: The matching records sorted by ``order``.
+    """
+    table = pq.read_table(
+        artifact_path(data_id), columns=columns, filters=filters, memory_map=True
+    )
+    if "order" in table.column_names:
+        table = table.sort_by("order")
+    return table
+
@@ -0,0 +1,60 @@
+"""
+Checks that the single-pass decoder produces the same records as the legacy
+decode_json -> json.loads -> ET.XML path, and compares their throughput.
+
+Usage:
+    python benchmarks/bench_decode.py path/to/log.mi2log
+"""
+
+# Standard Library Imports
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Local Imports
+from my_analyzer import my_analysis
+
+
+def decode(bytes_log: bytes, legacy_decode: bool) -> tuple[list, float]:
+    """
+    Replays the log through one decoding path.
+
+    Returns:
+        tuple: The normalized records and the elapsed time in seconds.
+    """
+    records = []
+    start = time.perf_counter()
+    my_analysis(bytes_log, sink=records.append, legacy_decode=legacy_decode)
+    return records, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("log", type=Path, help="recorded mi2log file")
+    args = parser.parse_args()
+
+    bytes_log = args.log.read_bytes()
+    legacy, legacy_time = decode(bytes_log, legacy_decode=True)
+    single, single_time = decode(bytes_log, legacy_decode=False)
+
+    print(f"legacy      : {len(legacy) / legacy_time:12.1f} msg/s")
+    print(f"single-pass : {len(single) / single_time:12.1f} msg/s")
+
+    if len(legacy) != len(single):
+        sys.exit(f"record count differs: {len(legacy)} != {len(single)}")
+    for expected, actual in zip(legacy, single):
+        # Compare serialized documents so that key order must match as well
+        if json.dumps(expected, default=str) != json.dumps(actual, default=str):
+            sys.exit(
+                f"record {expected['order']} differs:\n"
+                f"  legacy      {expected}\n  single-pass {actual}"
+            )
+    print(f"{len(single)} records identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Times the ingest and export pipeline at several log sizes and writes the
+results as JSON, so runs can be compared for regressions.
+
+Logs are synthetic (or recorded messages scaled to each size, see
+``--messages``) and replayed by ``fake_replayer.FakeReplayer``, so the suite
+runs without the native decoder. It measures analyzer callback throughput,
+ingest (batch insert) throughput, the record window query of the Display
+tab, and its JSON and mi2log exports.
+
+Usage:
+    python benchmarks/bench_ingest.py --sizes 1000 10000 --output results.json
+    python benchmarks/bench_ingest.py --mongomock --baseline results.json
+"""
+
+# Standard Library Imports
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+BENCH_DB_NAME = "mi_benchmark"
+
+
+def use_mongomock():
+    """
+    Points every MongoClient of the app at one in-memory mongomock client.
+    """
+    import mongomock
+    import mongomock.gridfs
+    import pymongo
+
+    mongomock.gridfs.enable_gridfs_integration()
+    shared = mongomock.MongoClient()
+
+    class SharedClient(mongomock.MongoClient):
+        def __new__(cls, *args, **kwargs):
+            return shared
+
+    pymongo.MongoClient = SharedClient
+
+
+def best_of(repeat: int, func) -> tuple:
+    """
+    Runs ``func`` ``repeat`` times.
+
+    Returns:
+        tuple: The shortest elapsed time in seconds and the last result.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_size(db, fs, messages: list, repeat: int) -> list:
+    """
+    Benchmarks one log size.
+
+    Returns:
+        list: One result dict per benchmark.
+    """
+    from fake_replayer import build_log
+    from config import RECORD_PAGE_SIZE, RECORD_PREFETCH_PAGES
+    from export import export_ndjson
+    from ingest import ingest_log
+    from my_analyzer import download_bytes, my_analysis
+    from storage import open_records
+
+    bytes_log = build_log(messages)
+    log_name = f"bench-{len(messages)}.mi2log"
+    results = []
+
+    def record(name, seconds, count, size=None):
+        result = {
+            "benchmark": name,
+            "messages": len(messages),
+            "seconds": round(seconds, 6),
+            "items_per_s": round(count / seconds, 1) if seconds else None,
+        }
+        if size is not None:
+            result["bytes"] = size
+            result["mb_per_s"] = round(size / 1e6 / seconds, 2) if seconds else None
+        results.append(result)
+        print(f"{len(messages):>8} {name:<20} {seconds:9.4f} s  {count:>8} items")
+
+    seconds, _ = best_of(repeat, lambda: my_analysis(bytes_log, sink=lambda r: None))
+    record("analyzer", seconds, len(messages), len(bytes_log))
+
+    seconds, ingest_result = best_of(
+        repeat, lambda: ingest_log(db, fs, log_name, bytes_log)
+    )
+    record("ingest", seconds, ingest_result["records"], len(bytes_log))
+    # Sustained rate of the bulk writer alone, for sizing the deployment
+    results[-1]["insert_docs_per_s"] = round(ingest_result["docs_per_s"], 1)
+    file_doc = db["mi2log"].find_one({"filename": log_name})
+
+    # record_window: the first window of the record table of the Display tab
+    collection, base = open_records(db, log_name)
+    seconds, rows = best_of(
+        repeat,
+        lambda: list(
+            collection.find(
+                {**base, "order": {"$gt": -1}},
+                {"type_id": 1, "timestamp": 1, "order": 1, "_id": 0},
+            )
+            .sort("order", 1)
+            .limit(RECORD_PAGE_SIZE * RECORD_PREFETCH_PAGES + 1)
+        ),
+    )
+    record("record_window", seconds, len(rows))
+
+    summary = file_doc["summary"]
+    start_date = summary["min_timestamp"]
+    end_date = summary["max_timestamp"] + timedelta(milliseconds=1)
+    query = {"timestamp": {"$gte": start_date, "$lt": end_date}}
+
+    # download_json: a fresh version per run so the spool is never reused
+    spools = []
+
+    def export_json():
+        spools.append(export_ndjson(db, log_name, query, uuid.uuid4().hex))
+        return spools[-1]
+
+    seconds, spool = best_of(repeat, export_json)
+    record("download_json", seconds, len(messages), os.path.getsize(spool))
+    for path in spools:
+        os.remove(path)
+
+    # download_bytes: from the frame index, then by replaying the log
+    args = {
+        "filename": log_name,
+        "type_id": [],
+        "start_date": start_date,
+        "end_date": end_date,
+    }
+    if file_doc.get("frame_index"):
+        seconds, data = best_of(repeat, lambda: download_bytes(args))
+        record("download_bytes_index", seconds, len(messages), len(data))
+    db["mi2log"].update_one({"_id": file_doc["_id"]}, {"$set": {"frame_index": False}})
+    seconds, data = best_of(repeat, lambda: download_bytes(args))
+    record("download_bytes_replay", seconds, len(messages), len(data))
+    return results
+
+
+def compare(results: list, baseline_path: str) -> None:
+    """
+    Prints the change in elapsed time against an earlier results file.
+    """
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = {
+            (result["benchmark"], result["messages"]): result["seconds"]
+            for result in json.load(baseline_file)["results"]
+        }
+    print(f"\nChange against {baseline_path}:")
+    for result in results:
+        before = baseline.get((result["benchmark"], result["messages"]))
+        if before:
+            change = (result["seconds"] - before) / before * 100
+            print(f"{result['messages']:>8} {result['benchmark']:<20} {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    parser.add_argument(
+        "--messages", help="NDJSON export of recorded messages to replay"
+    )
+    parser.add_argument(
+        "--mongomock", action="store_true", help="use in-memory mongomock"
+    )
+    parser.add_argument(
+        "--database", default=BENCH_DB_NAME, help="scratch database, dropped after"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    # The database is chosen before config is imported; it is dropped afterwards
+    os.environ["MI_MONGO_DB"] = args.database
+    if args.mongomock:
+        use_mongomock()
+
+    from gridfs import GridFS
+
+    import fake_replayer
+    from artifacts import remove_artifact
+    from config import MONGO_DB_NAME, MONGO_URI
+
+    # Before my_analyzer is imported, as it needs mobile_insight
+    fake_replayer.install()
+    from my_analyzer import client, db
+
+    fs = GridFS(db)
+    if args.messages:
+        recorded = fake_replayer.load_messages(args.messages)
+
+    results = []
+    try:
+        for size in args.sizes:
+            if args.messages:
+                messages = fake_replayer.scale_messages(recorded, size)
+            else:
+                messages = fake_replayer.synthetic_messages(size, args.seed)
+            results += run_size(db, fs, messages, args.repeat)
+    finally:
+        for file_doc in db["mi2log"].find({}, {"data_id": 1}):
+            remove_artifact(file_doc["data_id"])
+        client.drop_database(MONGO_DB_NAME)
+
+    with open(args.output, "w", encoding="utf-8") as out:
+        json.dump(
+            {
+                "created_at": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "mongo": "mongomock" if args.mongomock else MONGO_URI,
+                "messages": args.messages or f"synthetic (seed {args.seed})",
+                "repeat": args.repeat,
+                "results": results,
+            },
+            out,
+            indent=2,
+        )
+    print(f"\nWrote {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
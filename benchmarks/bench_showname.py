@@ -0,0 +1,71 @@
+"""
+Measures myAnalyzer callback throughput on a recorded mi2log file with the
+legacy NumPy showname stripping and with the memoized normalize_showname.
+
+Usage:
+    python benchmarks/bench_showname.py path/to/log.mi2log [--repeat N]
+"""
+
+# Standard Library Imports
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Third-Party Library Imports
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Local Imports
+import my_analyzer
+
+
+def legacy_normalize_showname(showname):
+    """
+    The NumPy prefix stripping used before normalize_showname was introduced.
+    """
+    mask = np.array([char.isalpha() for char in list(showname)])
+    start_idx = np.where(mask)[0][0]
+    return showname[start_idx:]
+
+
+def run(bytes_log: bytes, normalize, repeat: int) -> float:
+    """
+    Replays the log ``repeat`` times with the given normalization function.
+
+    Returns:
+        float: The best observed throughput in messages per second.
+    """
+    cached = my_analyzer.normalize_showname
+    my_analyzer.normalize_showname = normalize
+    try:
+        best = 0.0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            analyzer = my_analyzer.my_analysis(bytes_log, sink=lambda record: None)
+            elapsed = time.perf_counter() - start
+            best = max(best, analyzer.record_count / elapsed)
+        return best
+    finally:
+        my_analyzer.normalize_showname = cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("log", type=Path, help="recorded mi2log file")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    bytes_log = args.log.read_bytes()
+    before = run(bytes_log, legacy_normalize_showname, args.repeat)
+    my_analyzer.normalize_showname.cache_clear()
+    after = run(bytes_log, my_analyzer.normalize_showname, args.repeat)
+
+    print(f"legacy numpy : {before:12.1f} msg/s")
+    print(f"memoized     : {after:12.1f} msg/s ({after / before:.2f}x)")
+    print(f"cache        : {my_analyzer.normalize_showname.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
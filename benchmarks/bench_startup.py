@@ -0,0 +1,166 @@
+"""
+Times the startup and rerun path of the Streamlit app and writes the results
+as JSON, so runs can be compared for regressions.
+
+The app is run headless with Streamlit's ``AppTest``. ``startup`` is the
+first run of the app in a fresh interpreter (module imports included) on an
+empty database; the other benchmarks run against a stored synthetic log in a
+warm process: ``first_render`` opens a session, ``rerun`` repeats the run of
+an open session as any widget interaction does, and ``next_page`` clicks
+through the record table.
+
+Usage:
+    python benchmarks/bench_startup.py --output startup.json
+    python benchmarks/bench_startup.py --mongomock --baseline startup.json
+"""
+
+# Standard Library Imports
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_ingest import BENCH_DB_NAME, best_of, compare, use_mongomock
+
+GUI_PATH = str(Path(__file__).resolve().parent.parent / "gui.py")
+APP_TIMEOUT = 120
+
+
+def configure(database: str, mongomock: bool) -> None:
+    """
+    Points the app at the scratch database before config is imported, without
+    starting ingest workers.
+    """
+    os.environ["MI_MONGO_DB"] = database
+    os.environ["MI_INGEST_WORKERS_AUTOSTART"] = "0"
+    if mongomock:
+        use_mongomock()
+
+
+def run_app():
+    """
+    Runs a new session of the app.
+
+    Returns:
+        AppTest: The session, after its first run.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(GUI_PATH, default_timeout=APP_TIMEOUT)
+    app.run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return app
+
+
+def measure_startup(args) -> float:
+    """
+    Returns the first run time of the app in a fresh interpreter.
+    """
+    command = [sys.executable, __file__, "--startup-child", "--database", args.database]
+    if args.mongomock:
+        command.append("--mongomock")
+    output = subprocess.run(command, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000, help="log size")
+    parser.add_argument("--repeat", type=int, default=5, help="best of N runs")
+    parser.add_argument(
+        "--mongomock", action="store_true", help="use in-memory mongomock"
+    )
+    parser.add_argument(
+        "--database", default=BENCH_DB_NAME, help="scratch database, dropped after"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_startup.json")
+    parser.add_argument("--baseline", help="earlier results file to compare with")
+    parser.add_argument("--startup-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    configure(args.database, args.mongomock)
+    if args.startup_child:
+        start = time.perf_counter()
+        run_app()
+        print(time.perf_counter() - start)
+        return
+
+    results = []
+
+    def record(name, seconds):
+        results.append(
+            {
+                "benchmark": name,
+                "messages": args.messages,
+                "seconds": round(seconds, 6),
+            }
+        )
+        print(f"{name:<16} {seconds * 1000:9.1f} ms")
+
+    # Fresh interpreters on the empty database, before the log is stored
+    record("startup", min(measure_startup(args) for _ in range(args.repeat)))
+
+    from gridfs import GridFS
+
+    import fake_replayer
+    from artifacts import remove_artifact
+    from config import MONGO_DB_NAME, MONGO_URI
+    from database import get_client
+    from ingest import ingest_log
+
+    fake_replayer.install()
+    db = get_client()[MONGO_DB_NAME]
+    try:
+        ingest_log(
+            db,
+            GridFS(db),
+            "bench-startup.mi2log",
+            fake_replayer.build_log(
+                fake_replayer.synthetic_messages(args.messages, args.seed)
+            ),
+        )
+
+        seconds, app = best_of(args.repeat, run_app)
+        record("first_render", seconds)
+        seconds, _ = best_of(args.repeat, app.run)
+        record("rerun", seconds)
+
+        def next_page():
+            return next(b for b in app.button if b.label == "Next Page").click().run()
+
+        seconds, _ = best_of(args.repeat, next_page)
+        record("next_page", seconds)
+    finally:
+        for file_doc in db["mi2log"].find({}, {"data_id": 1}):
+            remove_artifact(file_doc["data_id"])
+        get_client().drop_database(MONGO_DB_NAME)
+
+    with open(args.output, "w", encoding="utf-8") as out:
+        json.dump(
+            {
+                "created_at": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "mongo": "mongomock" if args.mongomock else MONGO_URI,
+                "repeat": args.repeat,
+                "results": results,
+            },
+            out,
+            indent=2,
+        )
+    print(f"\nWrote {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Stand-in for mobile_insight's OfflineReplayer used by the benchmarks.
+
+Decoded messages, synthetic or recorded (an NDJSON export of a stored log),
+are encoded into a mi2log-like blob: one HDLC frame per message with a real
+DIAG log header (lengths, log code, QCDM timestamp) and the message as JSON
+payload. ``FakeReplayer`` replays such a blob through the analyzer source API
+and honours ``enable_log`` filters for exports, so ingest, the frame locator
+and both export paths run unchanged without the native decoder. Where
+mobile_insight itself is not installed, ``install`` registers stand-in
+analyzer and monitor modules so my_analyzer can be imported.
+"""
+
+# Standard Library Imports
+import json
+import random
+import sys
+import types
+from datetime import datetime, timedelta
+from xml.sax.saxutils import quoteattr
+
+# Local Imports
+from mi2log_frames import (
+    ESCAPE,
+    FRAME_END,
+    LOG_CMD_CODE,
+    LOG_HEADER,
+    QCDM_EPOCH,
+    QCDM_TICKS_PER_SECOND,
+    iter_frames,
+    qcdm_timestamp,
+    unescape,
+)
+
+SYNTHETIC_START = datetime(2024, 1, 1, 12)
+SYNTHETIC_TYPES = [
+    "LTE_RRC_OTA_Packet",
+    "LTE_PHY_Serv_Cell_Measurement",
+    "LTE_NAS_EMM_OTA_Incoming_Packet",
+    "LTE_MAC_UL_Tx_Statistics",
+]
+
+
+def msg_xml(fields: dict) -> str:
+    """
+    Renders a showname -> value dict as the XML the decoder produces.
+    """
+    return "<msg><packet><proto>%s</proto></packet></msg>" % "".join(
+        f"<field showname={quoteattr(name)} value={quoteattr(str(value))}/>"
+        for name, value in fields.items()
+    )
+
+
+def synthetic_messages(count: int, seed: int = 0) -> list:
+    """
+    Generates decoded messages with a realistic mix of types and Msg sizes.
+    """
+    rng = random.Random(seed)
+    messages = []
+    timestamp = SYNTHETIC_START
+    for idx in range(count):
+        timestamp += timedelta(microseconds=rng.randint(100, 20000))
+        type_id = SYNTHETIC_TYPES[idx % len(SYNTHETIC_TYPES)]
+        fields = {
+            f"field{field}: {rng.randint(0, 99)}": f"{rng.getrandbits(32):08x}"
+            for field in range(rng.randint(4, 40))
+        }
+        fields["physCellId"] = str(rng.randint(0, 503))
+        messages.append(
+            {"type_id": type_id, "timestamp": timestamp, "Msg": msg_xml(fields)}
+        )
+    return messages
+
+
+def load_messages(path: str) -> list:
+    """
+    Loads recorded messages from an NDJSON export of a stored log.
+    """
+    messages = []
+    with open(path, encoding="utf-8") as ndjson_file:
+        for line in ndjson_file:
+            record = json.loads(line)
+            record.pop("order", None)
+            record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+            if isinstance(record.get("Msg"), dict):
+                record["Msg"] = msg_xml(record["Msg"])
+            messages.append(record)
+    return messages
+
+
+def scale_messages(messages: list, count: int) -> list:
+    """
+    Repeats or truncates messages to ``count``, shifting the timestamps of
+    each repetition past the previous one.
+    """
+    span = messages[-1]["timestamp"] - messages[0]["timestamp"] + timedelta(seconds=1)
+    return [
+        {
+            **messages[idx % len(messages)],
+            "timestamp": messages[idx % len(messages)]["timestamp"]
+            + span * (idx // len(messages)),
+        }
+        for idx in range(count)
+    ]
+
+
+def escape(data: bytes) -> bytes:
+    """
+    Applies HDLC byte stuffing.
+    """
+    out = bytearray()
+    for byte in data:
+        if byte in (FRAME_END, ESCAPE):
+            out += bytes([ESCAPE, byte ^ 0x20])
+        else:
+            out.append(byte)
+    return bytes(out)
+
+
+def build_log(messages: list) -> bytes:
+    """
+    Encodes decoded messages into a mi2log-like blob.
+    """
+    type_codes = {}
+    frames = []
+    for message in messages:
+        code = type_codes.setdefault(message["type_id"], len(type_codes) + 1)
+        elapsed = message["timestamp"] - QCDM_EPOCH
+        ticks = int(elapsed / timedelta(seconds=1) * QCDM_TICKS_PER_SECOND) + 1
+        payload = json.dumps(
+            {k: v for k, v in message.items() if k not in ("timestamp", "log_msg_len")}
+        ).encode()
+        length = LOG_HEADER.size - 4 + len(payload)
+        header = LOG_HEADER.pack(LOG_CMD_CODE, 0, length, length, code, ticks)
+        frames.append(escape(header + payload) + bytes([FRAME_END]))
+    return b"".join(frames)
+
+
+class FakeData:
+    """
+    The decoded payload of a message, as exposed by the native decoder.
+    """
+
+    def __init__(self, message: dict):
+        self.message = message
+
+    def decode(self) -> dict:
+        return dict(self.message)
+
+    def decode_json(self) -> str:
+        return json.dumps(self.message, default=str)
+
+
+class FakeEvent:
+    def __init__(self, timestamp, type_id, data):
+        self.timestamp = timestamp
+        self.type_id = type_id
+        self.data = data
+
+
+class FakeReplayer:
+    """
+    Replays a blob written by ``build_log`` like OfflineReplayer.
+    """
+
+    def __init__(self):
+        self.to_list = []
+        self.input_file = None
+        self.filters = None
+        self.output_bytes_object = bytearray()
+
+    def register(self, analyzer):
+        if analyzer not in self.to_list:
+            self.to_list.append(analyzer)
+
+    def deregister(self, analyzer):
+        if analyzer in self.to_list:
+            self.to_list.remove(analyzer)
+
+    def set_input_file(self, input_file):
+        self.input_file = input_file
+
+    def enable_log_all(self, start_date=None, end_date=None):
+        if start_date is not None:
+            self.filters = [(None, start_date, end_date)]
+
+    def enable_log(self, type_id, start_date=None, end_date=None):
+        self.filters = (self.filters or []) + [(type_id, start_date, end_date)]
+
+    def run(self):
+        blob = self.input_file
+        if not isinstance(blob, (bytes, bytearray)):
+            with open(blob, "rb") as log_file:
+                blob = log_file.read()
+        for offset, length in iter_frames(blob):
+            frame = unescape(blob[offset : offset + length - 1], length)
+            _, _, msg_len, _, _, ticks = LOG_HEADER.unpack_from(frame)
+            message = json.loads(frame[LOG_HEADER.size :])
+            message["log_msg_len"] = msg_len
+            message["timestamp"] = qcdm_timestamp(ticks)
+            if self.filters is not None:
+                # Export mode: copy the frames of the enabled logs
+                for type_id, start_date, end_date in self.filters:
+                    if type_id in (None, message["type_id"]) and (
+                        start_date is None
+                        or start_date <= message["timestamp"] < end_date
+                    ):
+                        self.output_bytes_object += blob[offset : offset + length]
+                        break
+                continue
+            event = FakeEvent(
+                message["timestamp"], message["type_id"], FakeData(message)
+            )
+            for analyzer in list(self.to_list):
+                analyzer.recv(self, event)
+
+
+class FakeAnalyzer:
+    """
+    Stand-in for the source API of mobile_insight's Analyzer.
+    """
+
+    def __init__(self):
+        self.source = None
+        self.source_callbacks = []
+
+    def add_source_callback(self, callback):
+        self.source_callbacks.append(callback)
+
+    def set_source(self, source):
+        self.source = source
+        source.register(self)
+
+    def recv(self, module, event):
+        if module is self.source:
+            for callback in self.source_callbacks:
+                callback(event)
+
+
+def install_stub_modules():
+    """
+    Registers ``mobile_insight.analyzer.analyzer`` and
+    ``mobile_insight.monitor`` modules exposing ``FakeAnalyzer`` and
+    ``FakeReplayer``.
+    """
+    package = types.ModuleType("mobile_insight")
+    analyzer_package = types.ModuleType("mobile_insight.analyzer")
+    analyzer = types.ModuleType("mobile_insight.analyzer.analyzer")
+    monitor = types.ModuleType("mobile_insight.monitor")
+    analyzer.Analyzer = FakeAnalyzer
+    analyzer.__all__ = ["Analyzer"]
+    monitor.OfflineReplayer = FakeReplayer
+    package.analyzer, package.monitor = analyzer_package, monitor
+    analyzer_package.analyzer = analyzer
+    sys.modules.update(
+        {
+            "mobile_insight": package,
+            "mobile_insight.analyzer": analyzer_package,
+            "mobile_insight.analyzer.analyzer": analyzer,
+            "mobile_insight.monitor": monitor,
+        }
+    )
+
+
+def install():
+    """
+    Makes my_analyzer replay logs through ``FakeReplayer``, installing the
+    stand-in mobile_insight modules first if the package is missing.
+    """
+    try:
+        import mobile_insight.analyzer.analyzer  # noqa: F401
+        import mobile_insight.monitor  # noqa: F401
+    except ImportError:
+        install_stub_modules()
+    import my_analyzer
+
+    my_analyzer.OfflineReplayer = FakeReplayer
@@ -0,0 +1,331 @@
+"""
+Raw log storage in GridFS, compressed in independent frames.
+
+A stored log is written as a sequence of frames, each holding the compression
+of up to ``BLOB_FRAME_SIZE`` raw bytes. Its fs.files document records the
+``compression``, the ``raw_length`` and, per frame, its raw and stored offset,
+so readers seek to the frame containing a raw offset and only decompress what
+they read. Logs stored without compression are plain GridFS files and are
+read as they are.
+"""
+
+# Standard Library Imports
+import bisect
+import gzip
+import hashlib
+import io
+from datetime import datetime
+
+# Third-Party Library Imports
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Local Imports
+from config import BLOB_COMPRESSION, BLOB_FRAME_SIZE
+
+# Size of the pieces in which an upload is read while it is stored or hashed
+READ_SIZE = 1024 * 1024
+
+
+def _compressors() -> dict:
+    compressors = {"gzip": (gzip.compress, gzip.decompress)}
+    if zstandard is not None:
+        compressors["zstd"] = (
+            zstandard.ZstdCompressor().compress,
+            zstandard.ZstdDecompressor().decompress,
+        )
+    return compressors
+
+
+COMPRESSORS = _compressors()
+
+
+def storage_compression(compression: str = BLOB_COMPRESSION):
+    """
+    Returns the compression new logs are stored with: zstd falls back to gzip
+    when the zstandard package is not installed, and "none" disables it.
+    """
+    if compression == "none":
+        return None
+    if compression not in COMPRESSORS:
+        return "gzip"
+    return compression
+
+
+def iter_source(source, start: int = 0, end: int = None):
+    """
+    Yields the content of bytes or a seekable binary file from ``start`` to
+    ``end`` in pieces of at most ``READ_SIZE`` bytes.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)[start:end]
+        for pos in range(0, len(view), READ_SIZE):
+            yield view[pos : pos + READ_SIZE]
+        return
+    source.seek(start)
+    remaining = None if end is None else end - start
+    while remaining is None or remaining > 0:
+        size = READ_SIZE if remaining is None else min(READ_SIZE, remaining)
+        piece = source.read(size)
+        if not piece:
+            return
+        if remaining is not None:
+            remaining -= len(piece)
+        yield piece
+
+
+def source_size(source) -> int:
+    """
+    Returns the length of bytes or a seekable binary file.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    return source.seek(0, io.SEEK_END)
+
+
+def hash_source(source, end: int = None) -> str:
+    """
+    Returns the SHA-256 digest of bytes or a seekable file, up to ``end``.
+    """
+    digest = hashlib.sha256()
+    for piece in iter_source(source, 0, end):
+        digest.update(piece)
+    return digest.hexdigest()
+
+
+def compress_frames(
+    pieces, compression: str, raw_offset: int = 0, stored_offset: int = 0
+):
+    """
+    Groups raw pieces into frames of ``BLOB_FRAME_SIZE`` bytes and compresses
+    them.
+
+    Yields:
+        tuple: The raw and stored offset of each frame and its stored bytes.
+    """
+    compress = COMPRESSORS[compression][0]
+    pending = bytearray()
+
+    def frame():
+        nonlocal raw_offset, stored_offset
+        data = compress(bytes(pending[:BLOB_FRAME_SIZE]))
+        entry = (raw_offset, stored_offset, data)
+        raw_offset += min(len(pending), BLOB_FRAME_SIZE)
+        stored_offset += len(data)
+        del pending[:BLOB_FRAME_SIZE]
+        return entry
+
+    for piece in pieces:
+        pending += piece
+        while len(pending) >= BLOB_FRAME_SIZE:
+            yield frame()
+    if pending:
+        yield frame()
+
+
+def put_blob(
+    fs, source, filename: str, start: int = 0, compression: str = BLOB_COMPRESSION
+) -> dict:
+    """
+    Streams bytes or a seekable binary file into GridFS from ``start`` on,
+    compressing it frame by frame and hashing it on the fly, so the upload is
+    never copied as a whole.
+
+    Args:
+        fs: The GridFS instance used to store raw logs.
+        source: The content, as bytes or a seekable binary file.
+        filename (str): The name of the log file.
+        start (int): The offset of the first byte to store.
+        compression (str): "zstd", "gzip" or "none".
+
+    Returns:
+        dict: The GridFS ``data_id``, the ``sha256`` digest and the raw
+        ``size`` of the stored bytes.
+    """
+    compression = storage_compression(compression)
+    digest = hashlib.sha256()
+    size = 0
+
+    def pieces():
+        nonlocal size
+        for piece in iter_source(source, start):
+            digest.update(piece)
+            size += len(piece)
+            yield piece
+
+    grid_in = fs.new_file(filename=filename)
+    try:
+        if compression is None:
+            for piece in pieces():
+                grid_in.write(bytes(piece))
+        else:
+            frames = []
+            for raw_offset, stored_offset, data in compress_frames(
+                pieces(), compression
+            ):
+                grid_in.write(data)
+                frames.append([raw_offset, stored_offset])
+            grid_in.compression = compression
+            grid_in.frames = frames
+            grid_in.raw_length = size
+        grid_in.sha256 = digest.hexdigest()
+    except BaseException:
+        grid_in.abort()
+        raise
+    grid_in.close()
+    return {"data_id": grid_in._id, "sha256": digest.hexdigest(), "size": size}
+
+
+def blob_size(db, data_id) -> int:
+    """
+    Returns the raw length of a stored log, 0 if it does not exist.
+    """
+    blob = db["fs.files"].find_one(
+        {"_id": data_id}, {"length": 1, "raw_length": 1}
+    )
+    if blob is None:
+        return 0
+    return blob.get("raw_length", blob["length"])
+
+
+class BlobReader(io.RawIOBase):
+    """
+    Seekable reader of a compressed stored log, keeping the last decompressed
+    frame.
+    """
+
+    def __init__(self, grid_out):
+        if grid_out.compression not in COMPRESSORS:
+            raise RuntimeError(
+                f"Stored log is {grid_out.compression} compressed, which is not "
+                "available; install the zstandard package."
+            )
+        self._grid_out = grid_out
+        self._decompress = COMPRESSORS[grid_out.compression][1]
+        self._raw_offsets = [raw for raw, _ in grid_out.frames]
+        self._stored_offsets = [stored for _, stored in grid_out.frames]
+        self._stored_offsets.append(grid_out.length)
+        self.length = grid_out.raw_length
+        self._pos = 0
+        self._frame_idx = None
+        self._frame = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.length
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        if self._pos >= self.length:
+            return 0
+        idx = bisect.bisect_right(self._raw_offsets, self._pos) - 1
+        if idx != self._frame_idx:
+            start, end = self._stored_offsets[idx], self._stored_offsets[idx + 1]
+            self._grid_out.seek(start)
+            self._frame = self._decompress(self._grid_out.read(end - start))
+            self._frame_idx = idx
+        offset = self._pos - self._raw_offsets[idx]
+        count = min(len(buffer), len(self._frame) - offset)
+        buffer[:count] = self._frame[offset : offset + count]
+        self._pos += count
+        return count
+
+
+def open_blob(fs, data_id):
+    """
+    Opens a stored log for streaming reads of its raw content.
+
+    Returns:
+        A seekable binary file.
+    """
+    grid_out = fs.get(data_id)
+    if getattr(grid_out, "compression", None) is None:
+        return grid_out
+    return io.BufferedReader(BlobReader(grid_out), BLOB_FRAME_SIZE)
+
+
+def read_blob(fs, data_id) -> bytes:
+    """
+    Returns the raw content of a stored log, for the replayer.
+    """
+    with open_blob(fs, data_id) as blob:
+        return blob.read()
+
+
+def extend_blob(db, data_id, data: bytes, sha256: str, base_length: int) -> None:
+    """
+    Appends bytes to a stored log in place: they are compressed into new
+    frames when the log is compressed, the last partial GridFS chunk is filled
+    up and new chunks are added, leaving the other chunks untouched.
+
+    The append is safe to retry: chunks are written from the stored length,
+    which only changes once all of them are in place, and an append that was
+    already applied is skipped.
+
+    Args:
+        db: The MongoDB database.
+        data_id: The GridFS id of the stored log.
+        data (bytes): The bytes to append.
+        sha256 (str): The digest of the whole new content.
+        base_length (int): The raw length of the log the bytes follow.
+
+    Raises:
+        RuntimeError: If the stored log is neither ``base_length`` long nor
+            already extended by ``data``.
+    """
+    files, chunks = db["fs.files"], db["fs.chunks"]
+    blob = files.find_one({"_id": data_id})
+    chunk_size, length = blob["chunkSize"], blob["length"]
+    raw_length = blob.get("raw_length", length)
+    if raw_length == base_length + len(data) and blob.get("sha256") == sha256:
+        return
+    if raw_length != base_length:
+        raise RuntimeError("The stored log changed before it could be extended.")
+    update = {"sha256": sha256, "uploadDate": datetime.now()}
+    new_frames = []
+    if blob.get("compression"):
+        stored = bytearray()
+        for raw_offset, stored_offset, frame in compress_frames(
+            iter_source(data), blob["compression"], raw_length, length
+        ):
+            new_frames.append([raw_offset, stored_offset])
+            stored += frame
+        update["raw_length"] = raw_length + len(data)
+        data = bytes(stored)
+
+    n, used = divmod(length, chunk_size)
+    pos = 0
+    if used and data:
+        pos = chunk_size - used
+        last = chunks.find_one({"files_id": data_id, "n": n})
+        # Cut to the stored length, as an interrupted attempt may have filled it
+        chunks.update_one(
+            {"_id": last["_id"]},
+            {"$set": {"data": bytes(last["data"])[:used] + data[:pos]}},
+        )
+        n += 1
+    for idx, start in enumerate(range(pos, len(data), chunk_size)):
+        chunks.update_one(
+            {"files_id": data_id, "n": n + idx},
+            {"$set": {"data": data[start : start + chunk_size]}},
+            upsert=True,
+        )
+    update["length"] = length + len(data)
+    change = {"$set": update}
+    if new_frames:
+        change["$push"] = {"frames": {"$each": new_frames}}
+    files.update_one({"_id": data_id, "length": length}, change)
@@ -0,0 +1,142 @@
+# Standard Library Imports
+import hashlib
+import pickle
+import time
+
+# Third-Party Library Imports
+import redis
+
+# Local Imports
+from config import (
+    REDIS_URL,
+    CACHE_TTL_SECONDS,
+    CACHE_MAX_ENTRIES,
+    CACHE_MAX_ENTRY_BYTES,
+    CACHE_RETRY_SECONDS,
+)
+
+
+class ResultCache:
+    """
+    Redis-backed cache for expensive query and export results, shared by every
+    app process.
+
+    Keys combine a namespace, the filename, the file's content version (its
+    SHA-256 digest and version counter, see ``export.content_version``) and a
+    digest of the filter arguments. A re-upload or append changes the digest,
+    and bumping the counter on re-upload, rename or delete makes the old
+    entries of a name unreachable; they are then evicted by their TTL or by
+    the LRU bound on the number of entries.
+
+    When Redis is unreachable, results are computed directly and Redis is not
+    tried again for ``CACHE_RETRY_SECONDS``, except to invalidate.
+    """
+
+    PREFIX = "mi2log"
+
+    def __init__(
+        self,
+        client=None,
+        ttl: int = CACHE_TTL_SECONDS,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_entry_bytes: int = CACHE_MAX_ENTRY_BYTES,
+    ):
+        self.client = client or redis.Redis.from_url(
+            REDIS_URL, socket_connect_timeout=0.5, socket_timeout=2
+        )
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_entry_bytes = max_entry_bytes
+        self._retry_at = 0.0
+
+    def _available(self) -> bool:
+        return time.monotonic() >= self._retry_at
+
+    def _failed(self) -> None:
+        self._retry_at = time.monotonic() + CACHE_RETRY_SECONDS
+
+    def version(self, filename: str) -> int:
+        """
+        Returns the content version of a file, 0 if it was never changed or
+        Redis is unavailable.
+        """
+        if not self._available():
+            return 0
+        try:
+            return int(self.client.get(f"{self.PREFIX}:version:{filename}") or 0)
+        except redis.RedisError:
+            self._failed()
+            return 0
+
+    def invalidate(self, *filenames: str) -> None:
+        """
+        Bumps the content version of files, dropping their cached results.
+        Redis is tried even while it is considered unavailable, as a missed
+        bump would leave results of the old content cached.
+        """
+        try:
+            with self.client.pipeline() as pipe:
+                for filename in filenames:
+                    pipe.incr(f"{self.PREFIX}:version:{filename}")
+                pipe.execute()
+        except redis.RedisError:
+            self._failed()
+        else:
+            self._retry_at = 0.0
+
+    def key(self, namespace: str, filename: str, version: str, args) -> str:
+        """
+        Builds the cache key of a result.
+        """
+        digest = hashlib.sha1(repr((version, args)).encode()).hexdigest()
+        return f"{self.PREFIX}:cache:{namespace}:{filename}:{digest}"
+
+    def get_or_compute(
+        self, namespace: str, filename: str, version: str, args, compute
+    ):
+        """
+        Returns the cached result for ``args`` or computes and caches it.
+
+        Args:
+            namespace (str): The kind of result, e.g. ``"json"``.
+            filename (str): The file the result is derived from.
+            version (str): The content version of the file.
+            args: The arguments the result depends on; must have a stable repr.
+            compute: Callable producing the result on a cache miss.
+        """
+        if not self._available():
+            return compute()
+
+        key = self.key(namespace, filename, version, args)
+        lru = f"{self.PREFIX}:lru"
+        try:
+            cached = self.client.get(key)
+            if cached is not None:
+                self.client.zadd(lru, {key: time.time()})
+                return pickle.loads(cached)
+        except redis.RedisError:
+            self._failed()
+            return compute()
+
+        result = compute()
+        payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_entry_bytes:
+            return result
+
+        try:
+            with self.client.pipeline() as pipe:
+                pipe.set(key, payload, ex=self.ttl)
+                pipe.zadd(lru, {key: time.time()})
+                pipe.zcard(lru)
+                size = pipe.execute()[-1]
+            if size > self.max_entries:
+                excess = size - self.max_entries
+                evicted = [k for k, _ in self.client.zpopmin(lru, excess)]
+                if evicted:
+                    self.client.delete(*evicted)
+        except redis.RedisError:
+            self._failed()
+        return result
+
+
+result_cache = ResultCache()
@@ -0,0 +1,206 @@
+"""
+Command-line batch ingest and export, without the Streamlit UI.
+
+    python cli.py ingest archive/ --workers 8
+    python cli.py export drive.mi2log --format json --type-id LTE_RRC_OTA_Packet \
+        --start 2024-01-01T12:00:00 --end 2024-01-01T13:00:00 -o rrc.ndjson
+
+Both commands use the same analyzer, storage and export code as the app and
+print their throughput per file.
+"""
+
+# Standard Library Imports
+import argparse
+import fnmatch
+import os
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Local Imports
+from my_analyzer import db
+from ingest import ingest_files
+from jobs import ensure_job_indexes
+from export import (
+    content_version,
+    export_mi2log,
+    export_ndjson,
+    export_parquet,
+    filter_query,
+)
+from artifacts import has_artifact
+from storage import record_source
+from summary import summarize_records
+from metrics import metrics
+from config import INGEST_WORKERS
+
+FORMAT_EXTENSIONS = {"mi2log": "mi2log", "json": "ndjson", "parquet": "parquet"}
+
+
+def collect_logs(paths: list, pattern: str) -> list:
+    """
+    Lists the log files to ingest: files given directly, and the files of the
+    given directories (recursively) matching ``pattern``.
+
+    Returns:
+        list: ``(log_name, path)`` pairs, named after the file's basename.
+    """
+    logs = []
+    for path in paths:
+        if not os.path.isdir(path):
+            logs.append((os.path.basename(path), path))
+            continue
+        for root, _, files in sorted(os.walk(path)):
+            for name in sorted(fnmatch.filter(files, pattern)):
+                logs.append((name, os.path.join(root, name)))
+    return logs
+
+
+def format_throughput(messages: int, size: int, seconds: float) -> str:
+    """
+    Formats message and byte throughput.
+    """
+    if not seconds:
+        return f"{messages} messages, {size / 1e6:.1f} MB"
+    return (
+        f"{messages} messages, {size / 1e6:.1f} MB in {seconds:.2f} s "
+        f"({messages / seconds:,.0f} msg/s, {size / 1e6 / seconds:.1f} MB/s)"
+    )
+
+
+def run_ingest(args) -> int:
+    """
+    Ingests log files in parallel worker processes.
+
+    Returns:
+        int: The number of files that failed.
+    """
+    logs = collect_logs(args.paths, args.pattern)
+    if not logs:
+        print("No log files found.", file=sys.stderr)
+        return 0
+
+    ensure_job_indexes(db)
+    files = failed = total_messages = total_bytes = 0
+    start = time.perf_counter()
+    for log_name, result, error in ingest_files(logs, args.workers):
+        files += 1
+        if error is None and result["errors"]:
+            error = "; ".join(result["errors"])
+        if error is not None:
+            failed += 1
+            print(f"{log_name}: failed: {error}", file=sys.stderr)
+            continue
+        total_messages += result["records"]
+        total_bytes += result["bytes"]
+        throughput = format_throughput(
+            result["records"], result["bytes"], result["seconds"]
+        )
+        if result.get("docs_per_s"):
+            throughput += f", {result['docs_per_s']:,.0f} docs/s inserted"
+        print(f"{log_name}: {throughput}")
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Ingested {files - failed} of {files} files: "
+        f"{format_throughput(total_messages, total_bytes, elapsed)}"
+    )
+    return failed
+
+
+def run_export(args) -> int:
+    """
+    Exports the filtered records of a stored log.
+
+    Returns:
+        int: 0 on success, 1 if the export is not possible.
+    """
+    file_doc = db["mi2log"].find_one({"filename": args.filename})
+    if file_doc is None:
+        print(f"{args.filename}: no such file", file=sys.stderr)
+        return 1
+
+    # Default to the whole file
+    summary = file_doc.get("summary") or summarize_records(db, file_doc)
+    start_date = args.start or summary["min_timestamp"]
+    end_date = args.end or summary["max_timestamp"] + timedelta(milliseconds=1)
+    query = filter_query(args.type_id, start_date, end_date)
+
+    extension = FORMAT_EXTENSIONS[args.format]
+    output = args.output or f"{os.path.splitext(args.filename)[0]}.filtered.{extension}"
+    version = content_version(db, args.filename)
+
+    start = time.perf_counter()
+    if args.format == "mi2log":
+        spool = export_mi2log(
+            db,
+            {
+                "filename": args.filename,
+                "type_id": args.type_id,
+                "start_date": start_date,
+                "end_date": end_date,
+            },
+            version,
+        )
+        shutil.copyfile(spool, output)
+    elif args.format == "json":
+        spool = export_ndjson(db, args.filename, query, version, args.gzip)
+        shutil.copyfile(spool, output)
+    else:
+        if not has_artifact(file_doc["data_id"]):
+            print(f"{args.filename}: no columnar artifact to export", file=sys.stderr)
+            return 1
+        spool = export_parquet(
+            file_doc["data_id"],
+            args.filename,
+            args.type_id,
+            start_date,
+            end_date,
+            version,
+        )
+        shutil.copyfile(spool, output)
+    elapsed = time.perf_counter() - start
+
+    collection, base = record_source(db, file_doc)
+    messages = collection.count_documents({**base, **query})
+    print(
+        f"{args.filename} -> {output}: "
+        f"{format_throughput(messages, os.path.getsize(output), elapsed)}"
+    )
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Batch ingest and export mi2log files."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Ingest log files.")
+    ingest_parser.add_argument("paths", nargs="+", help="Log files or directories")
+    ingest_parser.add_argument("--pattern", default="*.mi2log")
+    ingest_parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+
+    export_parser = commands.add_parser("export", help="Export a stored log.")
+    export_parser.add_argument("filename")
+    export_parser.add_argument(
+        "--format", choices=list(FORMAT_EXTENSIONS), default="mi2log"
+    )
+    export_parser.add_argument("--type-id", action="append", default=[])
+    export_parser.add_argument("--start", type=datetime.fromisoformat)
+    export_parser.add_argument("--end", type=datetime.fromisoformat)
+    export_parser.add_argument("--gzip", action="store_true", help="Gzip JSON output")
+    export_parser.add_argument("-o", "--output")
+
+    args = parser.parse_args()
+    if args.command == "ingest":
+        failed = run_ingest(args)
+    else:
+        failed = run_export(args)
+    metrics.flush()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 PAGE_TOP_STYLE = """
         <style>
                .block-container {
@@ -12,4 +15,154 @@ PAGE_TOP_STYLE = """
                     display: none
                 }
         </style>
-        """
\ No newline at end of file
+        """
+
+# --- MongoDB ---
+MONGO_URI = os.environ.get("MI_MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB_NAME = os.environ.get("MI_MONGO_DB", "mobile_insight")
+# Connection pool bounds of the shared client, per process.
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MI_MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MI_MONGO_MIN_POOL_SIZE", 0))
+# Milliseconds a request waits for a free pooled connection before failing.
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(
+    os.environ.get("MI_MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000)
+)
+# Milliseconds to wait for a reachable server and for a new connection.
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 5000
+MONGO_CONNECT_TIMEOUT_MS = 5000
+
+# --- Ingest ---
+# Number of worker processes used to ingest a batch of uploaded files.
+INGEST_WORKERS = int(os.environ.get("MI_INGEST_WORKERS", os.cpu_count() or 1))
+# Start ingest worker processes (jobs.py) together with the Streamlit app.
+INGEST_WORKERS_AUTOSTART = os.environ.get("MI_INGEST_WORKERS_AUTOSTART", "1") == "1"
+# Seconds a worker owns a job without renewing its lease before another worker
+# may take it over.
+JOB_LEASE_SECONDS = 60
+# Seconds between job queue polls and job progress updates.
+JOB_POLL_SECONDS = 1
+# Maximum number of decoded records per insert_many call.
+INGEST_BATCH_SIZE = int(os.environ.get("MI_INGEST_BATCH_SIZE", 1024))
+# Maximum BSON size in bytes of the records per insert_many call, for logs
+# with large Msg fields; 0 batches by count only (sizing costs an encode).
+INGEST_BATCH_BYTES = int(os.environ.get("MI_INGEST_BATCH_BYTES", 0))
+# Number of threads inserting batches concurrently (unordered) per ingest.
+INGEST_WRITER_THREADS = int(os.environ.get("MI_INGEST_WRITER_THREADS", 2))
+# Number of full batches that may wait for the writer threads before the
+# analyzer is paused; bounds ingest memory to roughly this many batches plus
+# one per writer thread.
+INGEST_QUEUE_BATCHES = 8
+# Write concern ("w") of record inserts, e.g. "1" or "majority"; empty uses
+# the client's. Unacknowledged writes ("0") cannot be retried and are refused.
+INGEST_WRITE_CONCERN = os.environ.get("MI_INGEST_WRITE_CONCERN", "")
+# Number of times a failed batch is retried, skipping the records that were
+# stored, and the delay before the first retry, doubled on each attempt.
+INGEST_INSERT_RETRIES = 3
+INGEST_RETRY_SECONDS = 0.5
+# Maximum number of distinct field shownames whose normalized key is cached.
+SHOWNAME_CACHE_SIZE = 65536
+# Decode messages through the original decode_json -> json.loads -> ET.XML
+# path instead of the single-pass decoder (for output-equivalence checks).
+LEGACY_DECODE = False
+# Number of mi2log frames searched ahead when matching a decoded record to the
+# frame it came from; records without a match disable indexed exports.
+FRAME_LOOKAHEAD = 64
+# Directory of the per-file columnar (Parquet) artifacts written at ingest.
+ARTIFACT_DIR = os.environ.get("MI_ARTIFACT_DIR", "artifacts")
+# Number of records per Parquet row group of an artifact.
+ARTIFACT_ROW_GROUP_SIZE = 65536
+
+# --- Blob Storage ---
+# Compression of the raw logs stored in GridFS: "zstd" (falls back to "gzip"
+# without the zstandard package), "gzip" or "none". Logs are read back
+# whatever compression they were stored with.
+BLOB_COMPRESSION = os.environ.get("MI_BLOB_COMPRESSION", "zstd")
+# Raw bytes per independently compressed frame of a stored log; readers
+# decompress one frame at a time.
+BLOB_FRAME_SIZE = 4 * 1024 * 1024
+
+# --- Display ---
+# Screen size assumed until the browser reports it, on the first rerun of a
+# session.
+DEFAULT_SCREEN_WIDTH = 1280
+DEFAULT_SCREEN_HEIGHT = 800
+# Seconds the list of stored files is kept in a session before it is queried
+# again; changes made in the session refresh it at once.
+FILE_LIST_TTL_SECONDS = 10
+# Number of records per page of the record table.
+RECORD_PAGE_SIZE = 200
+# Number of pages read from MongoDB at once; neighbouring pages are served
+# from the same window without another query.
+RECORD_PREFETCH_PAGES = 5
+
+# --- Result Cache ---
+REDIS_URL = os.environ.get("MI_REDIS_URL", "redis://localhost:6379/0")
+# Seconds a cached query or export result is kept.
+CACHE_TTL_SECONDS = 3600
+# Maximum number of cached results; the least recently used are evicted.
+CACHE_MAX_ENTRIES = 256
+# Results larger than this many bytes are not cached.
+CACHE_MAX_ENTRY_BYTES = 64 * 1024 * 1024
+# Seconds to bypass the cache after Redis could not be reached.
+CACHE_RETRY_SECONDS = 30
+
+# --- Export ---
+# Directory of the on-disk spool files that exports are served from.
+EXPORT_SPOOL_DIR = os.environ.get(
+    "MI_EXPORT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "mi2log_exports")
+)
+# Seconds an unused spool file is kept before it is removed.
+EXPORT_SPOOL_TTL_SECONDS = 3600
+# Number of records fetched from MongoDB per cursor batch during exports.
+EXPORT_BATCH_SIZE = 1000
+# Number of exports prepared in parallel in the background.
+EXPORT_WORKERS = int(os.environ.get("MI_EXPORT_WORKERS", 2))
+# Address of the HTTP server that serves prepared exports with range requests,
+# and the URL browsers reach it at (e.g. through a reverse proxy or an ssh
+# port forward).
+EXPORT_HTTP_HOST = os.environ.get("MI_EXPORT_HTTP_HOST", "127.0.0.1")
+EXPORT_HTTP_PORT = int(os.environ.get("MI_EXPORT_HTTP_PORT", 8502))
+EXPORT_HTTP_URL = os.environ.get(
+    "MI_EXPORT_HTTP_URL", f"http://localhost:{EXPORT_HTTP_PORT}"
+).rstrip("/")
+
+# --- Storage ---
+# Layout of newly ingested records: "collection" keeps one collection per log
+# file, "timeseries" stores every file in one time-series collection keyed by
+# file id (requires MongoDB 7.0). Run storage.py to migrate existing files.
+STORAGE_MODE = os.environ.get("MI_STORAGE_MODE", "collection")
+# Bucket granularity of the time-series collection.
+TIMESERIES_GRANULARITY = "seconds"
+# Storage of the decoded Msg fields of new logs: "plain" keys them by their
+# shownames, "compact" by short keys from the msg_schema registry (see
+# msg_schema.py); readers decode both.
+MSG_ENCODING = os.environ.get("MI_MSG_ENCODING", "plain")
+
+# --- Msg Queries ---
+# Msg fields (normalized shownames, comma separated) indexed in every ingested
+# log, in addition to the most queried ones.
+MSG_INDEX_FIELDS = [
+    field for field in os.environ.get("MI_MSG_INDEX_FIELDS", "").split(",") if field
+]
+# Number of most queried Msg fields that are indexed at ingest.
+MSG_INDEX_AUTO_FIELDS = 5
+# Number of queries on a Msg field before it is indexed at ingest.
+MSG_INDEX_MIN_QUERIES = 3
+# Number of matches per page of the Msg field query panel.
+QUERY_PAGE_SIZE = 100
+
+# --- Summary ---
+# Bucket sizes in seconds of the record histograms precomputed at ingest.
+SUMMARY_BUCKET_SECONDS = [1, 5, 10, 30, 60]
+# Histograms with more buckets than this are not stored in the summary.
+SUMMARY_MAX_BUCKETS = 100000
+
+# --- Metrics ---
+# Time the stages of ingest, queries and exports; off by default, and nearly
+# free when off.
+METRICS_ENABLED = os.environ.get("MI_METRICS", "0") == "1"
+# Directory where each process writes its metrics, merged by the admin panel
+# and by `python metrics.py`.
+METRICS_DIR = os.environ.get(
+    "MI_METRICS_DIR", os.path.join(tempfile.gettempdir(), "mi2log_metrics")
+)
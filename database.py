@@ -0,0 +1,145 @@
+"""
+Process-wide MongoDB client.
+
+Every module and Streamlit session of a process shares one pooled client,
+configured from ``config.py``; ``pool_stats`` reports how its connection pool
+is used, for tuning ``MONGO_MAX_POOL_SIZE`` under concurrent users.
+"""
+
+# Standard Library Imports
+import threading
+
+# Third-Party Library Imports
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+
+# Local Imports
+from config import (
+    MONGO_URI,
+    MONGO_DB_NAME,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+)
+
+
+class PoolStats(ConnectionPoolListener):
+    """
+    Counts the connection pool events of the shared client.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.failed_checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current counters.
+        """
+        with self._lock:
+            attempts = self.checkouts + self.failed_checkouts
+            return {
+                "open connections": self.open,
+                "checked out": self.checked_out,
+                "waiting": self.waiting,
+                "checkouts": self.checkouts,
+                "failed checkouts": self.failed_checkouts,
+                "mean wait (ms)": (
+                    1000 * self.wait_seconds / attempts if attempts else 0.0
+                ),
+                "max wait (ms)": 1000 * self.max_wait_seconds,
+            }
+
+    def _waited(self, duration: float) -> None:
+        self.waiting -= 1
+        self.wait_seconds += duration
+        self.max_wait_seconds = max(self.max_wait_seconds, duration)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._waited(event.duration)
+            self.checked_out += 1
+            self.checkouts += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._waited(event.duration)
+            self.failed_checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+_client = None
+_client_lock = threading.Lock()
+_pool_stats = PoolStats()
+
+
+def get_client() -> MongoClient:
+    """
+    Returns the MongoDB client of this process, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    MONGO_URI,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    event_listeners=[_pool_stats],
+                )
+    return _client
+
+
+def get_database(name: str = MONGO_DB_NAME):
+    """
+    Returns a database of the shared client.
+    """
+    return get_client()[name]
+
+
+def pool_stats() -> dict:
+    """
+    Returns the connection pool counters of the shared client.
+    """
+    return _pool_stats.snapshot()
@@ -0,0 +1,233 @@
+# Standard Library Imports
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Third-Party Library Imports
+import pyarrow.parquet as pq
+from gridfs import GridFS
+
+# Local Imports
+from artifacts import artifact_filters, read_artifact
+from blobs import open_blob
+from cache import result_cache
+from mi2log_frames import copy_frames
+from storage import open_records
+from msg_schema import open_codec
+from metrics import metrics
+from config import EXPORT_BATCH_SIZE, EXPORT_SPOOL_DIR, EXPORT_SPOOL_TTL_SECONDS
+
+# Exported records leave out the MongoDB id, the frame byte range and the file
+# id of the time-series layout
+RECORD_PROJECTION = {"_id": 0, "offset": 0, "length": 0, "file_id": 0}
+
+
+def content_version(db, filename: str) -> str:
+    """
+    Returns the content version of a file, combining its SHA-256 digest with
+    its cache version so cached results and exports never outlive a re-upload,
+    even when Redis is unavailable.
+    """
+    file_doc = db["mi2log"].find_one({"filename": filename}, {"sha256": 1})
+    sha256 = file_doc.get("sha256", "") if file_doc else ""
+    return f"{sha256}:{result_cache.version(filename)}"
+
+
+def spool_path(filename: str, query: dict, version: str, extension: str) -> str:
+    """
+    Returns the spool file of an export, named after its arguments so the same
+    export is served again from disk until the file changes.
+    """
+    digest = hashlib.sha1(repr((filename, query, version)).encode()).hexdigest()
+    return os.path.join(EXPORT_SPOOL_DIR, f"{digest}.{extension}")
+
+
+def partial_spool_path(path: str) -> str:
+    """
+    Returns the file an export is written to before it is moved to ``path``,
+    unique per process and thread so concurrent exports never share it.
+    """
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+
+
+def filter_query(type_ids: list, start_date, end_date) -> dict:
+    """
+    Returns the record filter of the Display tab export filters.
+    """
+    query = {"timestamp": {"$gte": start_date, "$lt": end_date}}
+    if type_ids:
+        query["type_id"] = {"$in": list(type_ids)}
+    return query
+
+
+def clean_spool(max_age: int = EXPORT_SPOOL_TTL_SECONDS) -> None:
+    """
+    Removes spool files older than ``max_age`` seconds.
+    """
+    if not os.path.isdir(EXPORT_SPOOL_DIR):
+        return
+    expiry = time.time() - max_age
+    for entry in os.scandir(EXPORT_SPOOL_DIR):
+        try:
+            if entry.stat().st_mtime < expiry:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def export_ndjson(
+    db,
+    filename: str,
+    query: dict,
+    version: str = "",
+    compress: bool = False,
+    progress=None,
+) -> str:
+    """
+    Streams the records matching a query into a compact NDJSON spool file, one
+    record per line in ``order``, without holding the export in memory.
+
+    Args:
+        db: The MongoDB database.
+        filename (str): The name of the log file.
+        query (dict): The record filter.
+        version (str): The content version of the file.
+        compress (bool): Whether to gzip the spool file.
+        progress: Optional callable receiving the number of records written,
+            once per cursor batch.
+
+    Returns:
+        str: The path of the spool file.
+    """
+    path = spool_path(filename, query, version, "ndjson.gz" if compress else "ndjson")
+    if os.path.exists(path):
+        os.utime(path)
+        metrics.count("export.spool_hits")
+        return path
+
+    clean_spool()
+    os.makedirs(EXPORT_SPOOL_DIR, exist_ok=True)
+    collection, base = open_records(db, filename)
+    codec = open_codec(db, filename)
+    cursor = (
+        collection.find({**base, **query}, RECORD_PROJECTION)
+        .sort("order", 1)
+        .batch_size(EXPORT_BATCH_SIZE)
+    )
+    opener = gzip.open if compress else open
+    partial_path = partial_spool_path(path)
+    try:
+        with metrics.timer("export.ndjson"), opener(
+            partial_path, "wt", encoding="utf-8"
+        ) as out:
+            for count, entry in enumerate(cursor, 1):
+                if codec:
+                    codec.decode_record(entry)
+                entry["timestamp"] = entry["timestamp"].isoformat()
+                out.write(json.dumps(entry, separators=(",", ":")))
+                out.write("\n")
+                if progress and count % EXPORT_BATCH_SIZE == 0:
+                    progress(count)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return path
+
+
+def export_parquet(
+    data_id, filename: str, type_ids: list, start_date, end_date, version: str = ""
+) -> str:
+    """
+    Writes the records of a stored log matching the Display tab filters from its
+    columnar artifact into a Parquet spool file.
+
+    Args:
+        data_id: The GridFS id of the stored log.
+        filename (str): The name of the log file.
+        type_ids (list): The type_ids to export, or an empty list for all.
+        start_date: The inclusive start of the time range.
+        end_date: The exclusive end of the time range.
+        version (str): The content version of the file.
+
+    Returns:
+        str: The path of the spool file.
+    """
+    query = (list(type_ids), start_date, end_date)
+    path = spool_path(filename, query, version, "parquet")
+    if os.path.exists(path):
+        os.utime(path)
+        metrics.count("export.spool_hits")
+        return path
+
+    clean_spool()
+    os.makedirs(EXPORT_SPOOL_DIR, exist_ok=True)
+    with metrics.timer("export.parquet_read"):
+        table = read_artifact(
+            data_id, filters=artifact_filters(type_ids, start_date, end_date)
+        )
+    partial_path = partial_spool_path(path)
+    try:
+        with metrics.timer("export.parquet_write"):
+            pq.write_table(table, partial_path)
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return path
+
+
+def export_mi2log(db, args: dict, version: str = "", progress=None) -> str:
+    """
+    Writes the frames of a stored log matching the Display tab filters into a
+    mi2log spool file. Logs with a frame index are copied range by range from
+    GridFS without holding the export in memory; others are replayed.
+
+    Args:
+        db: The MongoDB database.
+        args (dict): The ``filename``, ``type_id``, ``start_date`` and
+            ``end_date`` filters, see ``my_analyzer.download_bytes``.
+        version (str): The content version of the file.
+        progress: Optional callable receiving the number of frames written,
+            once per ``EXPORT_BATCH_SIZE`` frames.
+
+    Returns:
+        str: The path of the spool file.
+    """
+    # The analyzer pulls in the native decoder, so it is imported on first use
+    from my_analyzer import download_bytes, frame_ranges
+
+    filename = args["filename"]
+    query = (list(args["type_id"]), args["start_date"], args["end_date"])
+    path = spool_path(filename, query, version, "mi2log")
+    if os.path.exists(path):
+        os.utime(path)
+        metrics.count("export.spool_hits")
+        return path
+
+    clean_spool()
+    os.makedirs(EXPORT_SPOOL_DIR, exist_ok=True)
+    file_doc = db["mi2log"].find_one({"filename": filename})
+
+    def counted(ranges):
+        for count, frame in enumerate(ranges, 1):
+            yield frame
+            if progress and count % EXPORT_BATCH_SIZE == 0:
+                progress(count)
+
+    partial_path = partial_spool_path(path)
+    try:
+        with metrics.timer("export.mi2log"), open(partial_path, "wb") as out:
+            if file_doc.get("frame_index"):
+                with open_blob(GridFS(db), file_doc["data_id"]) as blob:
+                    copy_frames(blob, counted(frame_ranges(file_doc, args)), out)
+            else:
+                out.write(download_bytes(args))
+        os.replace(partial_path, path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return path
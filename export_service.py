@@ -0,0 +1,424 @@
+"""
+Background exports served over HTTP.
+
+Filtered exports of the Display tab are prepared by ``ExportService`` in a
+pool of worker threads, each writing a spool file (see export.py) while
+reporting its progress, so neither the browser connection nor the app holds
+the export in memory. Finished spool files are served by a small HTTP server
+that answers byte-range requests, so interrupted downloads of multi-GB
+exports resume where they stopped. Each finished export is downloaded by a
+random token handed out to the session that prepared it, as the server does
+not check the app login. The app starts the server on launch; it
+can also be run on its own, e.g. behind a reverse proxy, with
+
+    python export_service.py --port 8502
+"""
+
+# Standard Library Imports
+import argparse
+import hashlib
+import mimetypes
+import os
+import re
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+# Local Imports
+from artifacts import has_artifact
+from blobs import READ_SIZE
+from export import (
+    content_version,
+    export_mi2log,
+    export_ndjson,
+    export_parquet,
+    filter_query,
+)
+from metrics import metrics
+from storage import open_records
+from config import (
+    EXPORT_HTTP_HOST,
+    EXPORT_HTTP_PORT,
+    EXPORT_HTTP_URL,
+    EXPORT_SPOOL_DIR,
+    EXPORT_SPOOL_TTL_SECONDS,
+    EXPORT_WORKERS,
+)
+
+# Download names of the export formats
+EXPORT_FILE_NAMES = {
+    "mi2log": "filtered_log.mi2log",
+    "ndjson": "filtered_log.ndjson",
+    "ndjson.gz": "filtered_log.ndjson.gz",
+    "parquet": "filtered_log.parquet",
+}
+
+# Spool files are named by a hex digest and their format extension
+SPOOL_NAME = re.compile(r"[0-9a-f]{40}\.[a-z0-9.]+")
+DOWNLOAD_NAME = re.compile(r"[\w.-]+")
+DOWNLOAD_TOKEN = re.compile(r"[\w-]{43}")
+
+
+def token_path(token: str) -> str:
+    """
+    Returns the file recording the spool file of a download token, named by
+    the digest of the token so the spool directory does not reveal it.
+    """
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    return os.path.join(EXPORT_SPOOL_DIR, f"{digest}.token")
+
+
+def publish_spool(path: str) -> str:
+    """
+    Returns a new random download token of a spool file.
+
+    Spool names are derived from a file's name and content, so they are not
+    served themselves. Tokens are kept as files next to the spool files, so
+    a server running in another process resolves them too, and they expire
+    with the spool files (see ``clean_spool``).
+    """
+    token = secrets.token_urlsafe(32)
+    with open(token_path(token), "w", encoding="utf-8") as token_file:
+        token_file.write(os.path.basename(path))
+    return token
+
+
+def resolve_token(token: str):
+    """
+    Returns the spool file of a download token, or None if the token is
+    unknown or its export has expired.
+    """
+    if not DOWNLOAD_TOKEN.fullmatch(token):
+        return None
+    try:
+        with open(token_path(token), encoding="utf-8") as token_file:
+            name = token_file.read()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(EXPORT_SPOOL_DIR, name)
+    if not SPOOL_NAME.fullmatch(name) or not os.path.isfile(path):
+        return None
+    return path
+
+
+class ExportService:
+    """
+    Runs export jobs in background threads and keeps their status.
+
+    A job is identified by its format, filters and the content version of the
+    file, so preparing the same export again, from any session, returns the
+    running or finished job instead of starting another one.
+    """
+
+    def __init__(self, db, workers: int = EXPORT_WORKERS):
+        self.db = db
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="export"
+        )
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, export_format: str, args: dict) -> str:
+        """
+        Queues an export of the records of ``args["filename"]`` matching the
+        Display tab filters.
+
+        Args:
+            export_format (str): One of ``EXPORT_FILE_NAMES``.
+            args (dict): The ``filename``, ``type_id``, ``start_date`` and
+                ``end_date`` filters.
+
+        Returns:
+            str: The id of the job.
+        """
+        self.prune()
+        version = content_version(self.db, args["filename"])
+        job_id = hashlib.sha1(
+            repr((export_format, args, version)).encode()
+        ).hexdigest()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and (
+                job["status"] in ("queued", "running")
+                or (job["status"] == "done" and resolve_token(job["token"]))
+            ):
+                return job_id
+            self._jobs[job_id] = {
+                "id": job_id,
+                "format": export_format,
+                "filename": args["filename"],
+                "status": "queued",
+                "records": 0,
+                "total": None,
+                "path": None,
+                "token": None,
+                "size": None,
+                "error": None,
+                "created_at": datetime.now(),
+            }
+        self._pool.submit(self._run, job_id, export_format, dict(args), version)
+        metrics.count(f"export_jobs.{export_format}")
+        return job_id
+
+    def job(self, job_id: str):
+        """
+        Returns a copy of a job, or None if it is unknown. A finished job whose
+        spool file has expired is reported as ``expired``.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+        if job["status"] == "done" and not resolve_token(job["token"]):
+            job["status"] = "expired"
+        return job
+
+    def prune(self, max_age: int = EXPORT_SPOOL_TTL_SECONDS) -> None:
+        """
+        Forgets jobs that failed or whose export expired more than ``max_age``
+        seconds after they finished, so sessions still show why a recent
+        export is not available.
+        """
+        expiry = datetime.now() - timedelta(seconds=max_age)
+        with self._lock:
+            jobs = [
+                job
+                for job in self._jobs.values()
+                if job["status"] in ("done", "failed")
+                and job["finished_at"] < expiry
+            ]
+        for job in jobs:
+            if job["status"] == "failed" or not resolve_token(job["token"]):
+                with self._lock:
+                    # Unless it was submitted again meanwhile
+                    if self._jobs.get(job["id"]) is job:
+                        del self._jobs[job["id"]]
+
+    def url(self, job_id: str) -> str:
+        """
+        Returns the download URL of a finished job.
+        """
+        job = self.job(job_id)
+        name = quote(EXPORT_FILE_NAMES[job["format"]])
+        return f"{EXPORT_HTTP_URL}/{job['token']}?name={name}"
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id: str, export_format: str, args: dict, version: str):
+        self._update(job_id, status="running", started_at=datetime.now())
+
+        def progress(records):
+            self._update(job_id, records=records)
+
+        try:
+            with metrics.timer(f"export_jobs.{export_format}"):
+                query = filter_query(
+                    args["type_id"], args["start_date"], args["end_date"]
+                )
+                collection, base = open_records(self.db, args["filename"])
+                self._update(
+                    job_id, total=collection.count_documents({**base, **query})
+                )
+                if export_format == "mi2log":
+                    path = export_mi2log(self.db, args, version, progress)
+                elif export_format == "parquet":
+                    file_doc = self.db["mi2log"].find_one(
+                        {"filename": args["filename"]}, {"data_id": 1}
+                    )
+                    if not has_artifact(file_doc["data_id"]):
+                        raise RuntimeError("The log has no columnar artifact.")
+                    path = export_parquet(
+                        file_doc["data_id"],
+                        args["filename"],
+                        args["type_id"],
+                        args["start_date"],
+                        args["end_date"],
+                        version,
+                    )
+                else:
+                    path = export_ndjson(
+                        self.db,
+                        args["filename"],
+                        query,
+                        version,
+                        export_format == "ndjson.gz",
+                        progress,
+                    )
+        except Exception as e:
+            self._update(
+                job_id, status="failed", error=str(e), finished_at=datetime.now()
+            )
+            metrics.count("export_jobs.failed")
+            return
+        total = self.job(job_id)["total"]
+        self._update(
+            job_id,
+            status="done",
+            records=total,
+            path=path,
+            token=publish_spool(path),
+            size=os.path.getsize(path),
+            finished_at=datetime.now(),
+        )
+
+
+def parse_range(header: str, size: int):
+    """
+    Parses a single-range ``Range`` header.
+
+    Returns:
+        tuple: The first and last byte of the range, or None if no byte of the
+        range is in the file.
+
+    Raises:
+        ValueError: If the header is malformed or asks for several ranges, in
+            which case it is ignored and the whole file is sent.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError(header)
+    first, _, last = spec.strip().partition("-")
+    if not first:
+        # Suffix range: the last ``last`` bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            return None
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = int(last) if last else None
+    if last is not None and last < first:
+        raise ValueError(header)
+    if first >= size:
+        return None
+    return first, size - 1 if last is None else min(last, size - 1)
+
+
+class SpoolRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves spool files by download token, with ``Range`` and ``If-Range``
+    support. The ``name`` query parameter sets the file name the browser saves
+    it under.
+    """
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def log_message(self, format, *args):
+        # Downloads are counted in the metrics instead of logged per request
+        pass
+
+    def _serve(self, send_body: bool) -> None:
+        url = urlsplit(self.path)
+        token = url.path.lstrip("/")
+        path = resolve_token(token)
+        if path is None:
+            self.send_error(404)
+            return
+        with open(path, "rb") as spool:
+            # Keep the spool file and its token while it is being downloaded
+            os.utime(path)
+            os.utime(token_path(token))
+            stat = os.fstat(spool.fileno())
+            size = stat.st_size
+            etag = f'"{stat.st_ino:x}-{size:x}"'
+            first, last, status = 0, size - 1, 200
+            range_header = self.headers.get("Range")
+            if range_header and self.headers.get("If-Range", etag) == etag:
+                try:
+                    byte_range = parse_range(range_header, size)
+                except ValueError:
+                    byte_range = (first, last)
+                else:
+                    if byte_range is None:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{size}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    status = 206
+                first, last = byte_range
+
+            name = os.path.basename(path)
+            download_name = parse_qs(url.query).get("name", [name])[0]
+            if not DOWNLOAD_NAME.fullmatch(download_name):
+                download_name = name
+            self.send_response(status)
+            self.send_header(
+                "Content-Type",
+                mimetypes.guess_type(download_name)[0] or "application/octet-stream",
+            )
+            self.send_header("Content-Length", str(last - first + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.send_header(
+                "Content-Disposition", f'attachment; filename="{download_name}"'
+            )
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {first}-{last}/{size}")
+            self.end_headers()
+            if not send_body:
+                return
+
+            spool.seek(first)
+            remaining = last - first + 1
+            try:
+                while remaining > 0:
+                    piece = spool.read(min(READ_SIZE, remaining))
+                    if not piece:
+                        break
+                    self.wfile.write(piece)
+                    remaining -= len(piece)
+            except (BrokenPipeError, ConnectionResetError):
+                # The download was interrupted; it resumes with a range request
+                metrics.count("export_server.interrupted")
+                return
+            metrics.count("export_server.bytes", last - first + 1 - remaining)
+
+
+def make_server(host: str = EXPORT_HTTP_HOST, port: int = EXPORT_HTTP_PORT):
+    """
+    Returns an HTTP server of spool files, handling each request in a thread.
+
+    Raises:
+        OSError: If the address is already in use, e.g. by a server started
+            separately.
+    """
+    server = ThreadingHTTPServer((host, port), SpoolRequestHandler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(host: str = EXPORT_HTTP_HOST, port: int = EXPORT_HTTP_PORT):
+    """
+    Starts serving spool files from a background thread, see ``make_server``.
+
+    Returns:
+        ThreadingHTTPServer: The running server.
+    """
+    server = make_server(host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve prepared exports.")
+    parser.add_argument("--host", default=EXPORT_HTTP_HOST)
+    parser.add_argument("--port", type=int, default=EXPORT_HTTP_PORT)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"Serving {EXPORT_SPOOL_DIR} on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
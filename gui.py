@@ -1,20 +1,51 @@
 # Standard Library Imports
+import atexit
+import os
+import signal
+import subprocess
+import sys
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 
 # Third-Party Library Imports
 import streamlit as st
 import pandas as pd
-from pymongo import MongoClient
-from pymongo.errors import BulkWriteError
 from gridfs import GridFS
-import plotly.express as px
 from streamlit_js_eval import streamlit_js_eval
 
 # Local Imports
-from my_analyzer import my_analysis, download_bytes
-from config import PAGE_TOP_STYLE
+from ingest import release_blob
+from storage import open_records, release_records, rename_records
+from msg_schema import open_codec
+from summary import summarize_records, summary_count, summary_histogram
+from query import (
+    OPERATORS,
+    build_msg_query,
+    explain_query,
+    query_page,
+    query_projection,
+    record_field_usage,
+)
+from database import get_client, pool_stats
+from metrics import metrics, render_prometheus
+from jobs import JOBS_COLLECTION, ensure_job_indexes, submit_job
+from cache import result_cache
+from export import RECORD_PROJECTION, content_version
+from export_service import ExportService, start_server
+from artifacts import has_artifact, remove_artifact
+from config import (
+    PAGE_TOP_STYLE,
+    DEFAULT_SCREEN_HEIGHT,
+    DEFAULT_SCREEN_WIDTH,
+    FILE_LIST_TTL_SECONDS,
+    RECORD_PAGE_SIZE,
+    RECORD_PREFETCH_PAGES,
+    INGEST_WORKERS_AUTOSTART,
+    JOB_POLL_SECONDS,
+    QUERY_PAGE_SIZE,
+    MONGO_DB_NAME,
+)
 
 
 # Streamlit App Setup
@@ -26,140 +57,564 @@ def initialize_app() -> tuple[str, str]:
     st.title("MobileInsight-Cloud")
     st.markdown(PAGE_TOP_STYLE, unsafe_allow_html=True)
 
-    # Screen Dimensions
-    screen_width = streamlit_js_eval(
-        js_expressions="parent.window.innerWidth", key="screen_width"
-    )
-    screen_height = streamlit_js_eval(
-        js_expressions="parent.window.innerHeight", key="screen_height"
-    )
-    time.sleep(0.1)  # Small delay for accurate size capture
+    # Screen dimensions are measured once per session: each measurement is a
+    # browser round trip, reported on the rerun after it is rendered
+    screen_size = st.session_state.get("screen_size")
+    if screen_size is None:
+        screen_width = streamlit_js_eval(
+            js_expressions="parent.window.innerWidth", key="screen_width"
+        )
+        screen_height = streamlit_js_eval(
+            js_expressions="parent.window.innerHeight", key="screen_height"
+        )
+        if screen_width is None or screen_height is None:
+            return DEFAULT_SCREEN_WIDTH, DEFAULT_SCREEN_HEIGHT
+        screen_size = st.session_state["screen_size"] = (screen_width, screen_height)
 
-    return screen_width, screen_height
+    return screen_size
 
 
 # Database Initialization
-def initialize_database(
-    host: str = "localhost", port: int = 27017, db_name: str = "mobile_insight"
-):
+def initialize_database(db_name: str = MONGO_DB_NAME):
     """
-    Connect to MongoDB and initialize GridFS.
+    Returns the shared MongoDB client, the database and GridFS. The client is
+    created once per process and reused by every session and rerun.
     """
-    client = MongoClient(host, port)
+    client = get_client()
     database = client[db_name]
     file_storage = GridFS(database)
     return client, database, file_storage
 
 
-# Helper function for datetime transformation
-def transform_datetime(
-    date_string: str, date_format: str = "%Y-%m-%d %H:%M:%S.%f"
-) -> datetime:
+@st.cache_resource
+def prepare_database() -> None:
+    """
+    Creates the indexes the app relies on once per app server instead of on
+    every rerun.
+    """
+    ensure_job_indexes(get_client()[MONGO_DB_NAME])
+
+
+def load_file_list() -> list:
+    """
+    Returns the stored files with their upload time, oldest first. The list is
+    kept in the session for ``FILE_LIST_TTL_SECONDS`` so reruns do not query
+    it again; uploads, renames and deletions made in this session drop it at
+    once (see ``invalidate_file_list``).
+    """
+    cached = st.session_state.get("file_list")
+    if cached is not None and time.monotonic() - cached[0] < FILE_LIST_TTL_SECONDS:
+        return cached[1]
+    files = list(
+        db["mi2log"]
+        .find({}, {"filename": 1, "upload_time": 1, "_id": 0})
+        .sort("upload_time", 1)
+    )
+    st.session_state["file_list"] = (time.monotonic(), files)
+    return files
+
+
+def invalidate_file_list() -> None:
+    """
+    Drops the file list of the session after the stored files changed.
+    """
+    st.session_state.pop("file_list", None)
+
+
+def forget_missing_file(filename: str) -> None:
+    """
+    Reruns the app with a fresh file list after a listed file was deleted or
+    renamed by another session, dropping it from the file selections.
+    """
+    invalidate_file_list()
+    if st.session_state.get("filename_selector") == filename:
+        del st.session_state["filename_selector"]
+    if filename in st.session_state.get("msg_query_files", []):
+        del st.session_state["msg_query_files"]
+    st.rerun()
+
+
+@st.cache_data
+def load_file_summary(filename: str, version: str) -> dict:
     """
-    Converts a date string into a datetime object based on the given format.
+    Loads the summary of a file written at ingest, so opening a file does not
+    depend on its size. Files stored before summaries existed are summarized
+    from their records once.
 
     Args:
-        date_string (str): The date string to transform.
-        date_format (str): The format of the date string (default: '%Y-%m-%d %H:%M:%S.%f').
+        filename (str): The name of the log file.
+        version (str): The content version of the file, part of the cache key.
 
     Returns:
-        datetime: The corresponding datetime object.
+        dict: The summary document, see ``SummaryBuilder.build``, or None if
+        the file no longer exists.
     """
-    try:
-        return datetime.strptime(date_string, date_format)
-    except ValueError as e:
-        st.error(f"Invalid date format: {e}")
+    file_doc = db["mi2log"].find_one({"filename": filename})
+    if file_doc is None:
+        return None
+    if file_doc.get("summary"):
+        return file_doc["summary"]
+    return summarize_records(db, file_doc)
+
+
+def load_file_overview(filename: str, version: str) -> dict:
+    """
+    Loads the type_ids and time range of a file from its summary.
+
+    Args:
+        filename (str): The name of the log file.
+        version (str): The content version of the file, part of the cache key.
+
+    Returns:
+        dict: The distinct ``type_ids`` and the ``min_timestamp`` and
+        ``max_timestamp`` of the file, or None if the file no longer exists.
+    """
+    summary = load_file_summary(filename, version)
+    if summary is None:
         return None
+    return {
+        "type_ids": sorted(summary["type_counts"]),
+        "min_timestamp": summary["min_timestamp"],
+        "max_timestamp": summary["max_timestamp"],
+    }
+
+
+@st.cache_data
+def count_records(filename: str, query: dict, version: str) -> int:
+    """
+    Counts the records matching a query.
+
+    Args:
+        filename (str): The name of the log file.
+        query (dict): The record filter.
+        version (str): The content version of the file, part of the cache key.
+
+    Returns:
+        int: The number of matching records.
+    """
+    collection, base = open_records(db, filename)
+    with metrics.timer("query.count"):
+        return collection.count_documents({**base, **query})
 
 
 @st.cache_data
-def load_data(filename: str) -> pd.DataFrame:
+def load_record_window(
+    filename: str, query: dict, after_order: int, limit: int, version: str
+) -> pd.DataFrame:
+    """
+    Loads the keys of the next records after a given order (keyset pagination).
+
+    Args:
+        filename (str): The name of the log file.
+        query (dict): The record filter.
+        after_order (int): The order of the last record before the window.
+        limit (int): The maximum number of records to load.
+        version (str): The content version of the file, part of the cache key.
+
+    Returns:
+        pd.DataFrame: The ``type_id``, ``timestamp`` and ``order`` of the records.
+    """
+    collection, base = open_records(db, filename)
+    data = (
+        collection.find(
+            {**base, **query, "order": {"$gt": after_order}},
+            {"type_id": 1, "timestamp": 1, "order": 1, "_id": 0},
+        )
+        .sort("order", 1)
+        .limit(limit)
+    )
+    with metrics.timer("query.record_window"):
+        return pd.DataFrame(list(data), columns=["type_id", "timestamp", "order"])
+
+
+def paginate_records(
+    filename: str, query: dict, version: str
+) -> tuple[pd.DataFrame, bool]:
+    """
+    Returns the visible page of records.
+
+    Pages are read in windows of ``RECORD_PREFETCH_PAGES`` pages, each window
+    starting after the last order of the previous one, so moving between nearby
+    pages does not query MongoDB again. The position resets when the query
+    changes.
+
+    Args:
+        filename (str): The name of the log file.
+        query (dict): The record filter.
+        version (str): The content version of the file.
+
+    Returns:
+        tuple: The page of records and whether a next page exists.
+    """
+    query_key = repr((filename, query, version))
+    if st.session_state.get("record_query_key") != query_key:
+        st.session_state["record_query_key"] = query_key
+        st.session_state["record_page"] = 0
+        st.session_state["record_window_starts"] = [-1]
+
+    window_size = RECORD_PAGE_SIZE * RECORD_PREFETCH_PAGES
+    window, page_in_window = divmod(
+        st.session_state["record_page"], RECORD_PREFETCH_PAGES
+    )
+    window_df = load_record_window(
+        filename,
+        query,
+        st.session_state["record_window_starts"][window],
+        window_size + 1,
+        version,
+    )
+
+    # The last order of a full window is where the next window starts
+    if len(window_df) > window_size and window + 1 == len(
+        st.session_state["record_window_starts"]
+    ):
+        st.session_state["record_window_starts"].append(
+            int(window_df["order"].iloc[window_size - 1])
+        )
+
+    start = page_in_window * RECORD_PAGE_SIZE
+    page_df = window_df.iloc[start : start + RECORD_PAGE_SIZE].reset_index(drop=True)
+    return page_df, len(window_df) > start + RECORD_PAGE_SIZE
+
+
+def change_record_page(step: int) -> None:
+    """
+    Moves the record table by ``step`` pages.
+    """
+    st.session_state["record_page"] += step
+
+
+def load_histogram(
+    filename: str,
+    type_ids: list,
+    start_date: pd.Timestamp,
+    end_date: pd.Timestamp,
+    timestamp_scale: int,
+    version: str,
+) -> pd.DataFrame:
     """
-    Loads data from the MongoDB collection into a Pandas DataFrame.
+    Counts the records per timestamp bucket with a MongoDB aggregation, so only
+    the bucket series leaves the database.
 
     Args:
-        filename (str): The name of the MongoDB collection.
+        filename (str): The name of the log file.
+        type_ids (list): The type_ids to count, or an empty list for all.
+        start_date (pd.Timestamp): The inclusive start of the time range.
+        end_date (pd.Timestamp): The exclusive end of the time range.
+        timestamp_scale (int): The bucket size in seconds.
+        version (str): The content version of the file, part of the cache key.
 
     Returns:
-        pd.DataFrame: A sorted DataFrame containing data from the collection.
+        pd.DataFrame: The bucket start ``timestamp`` and its record ``count``.
     """
+    query = {"timestamp": {"$gte": start_date, "$lt": end_date}}
+    if type_ids:
+        query["type_id"] = {"$in": type_ids}
+    pipeline = [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": {
+                    "$dateTrunc": {
+                        "date": "$timestamp",
+                        "unit": "second",
+                        "binSize": timestamp_scale,
+                    }
+                },
+                "count": {"$sum": 1},
+            }
+        },
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "timestamp": "$_id", "count": 1}},
+    ]
+
+    def aggregate_histogram() -> pd.DataFrame:
+        collection, base = open_records(db, filename)
+        with metrics.timer("query.histogram"):
+            count_df = pd.DataFrame(
+                collection.aggregate([{"$match": base}, *pipeline]),
+                columns=["timestamp", "count"],
+            )
+        count_df["timestamp"] = pd.to_datetime(count_df["timestamp"])
+        return count_df
+
     try:
-        data = db[filename].find(
-            {}, {"type_id": 1, "timestamp": 1, "order": 1, "_id": 0}
+        return result_cache.get_or_compute(
+            "histogram", filename, version, pipeline, aggregate_histogram
         )
-        df = pd.DataFrame(data)
-        return df.sort_values(by="order").reset_index(drop=True)
     except Exception as e:
-        st.error(f"Error loading data: {e}")
-        return pd.DataFrame()
+        st.error(f"Error loading histogram: {e}")
+        return pd.DataFrame(columns=["timestamp", "count"])
+
+
+@st.cache_resource
+def start_ingest_workers():
+    """
+    Starts the ingest worker processes once per app server, so uploads are
+    processed even when no worker was started separately.
+    """
+    if not INGEST_WORKERS_AUTOSTART:
+        return None
+    # In a process group of their own, so the workers are stopped with the app
+    # even if the parent worker process is gone
+    workers = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(__file__), "jobs.py")],
+        start_new_session=True,
+    )
+    atexit.register(stop_ingest_workers, workers)
+    return workers
+
+
+def stop_ingest_workers(workers) -> None:
+    """
+    Stops the process group of the ingest workers started by the app.
+    """
+    try:
+        os.killpg(workers.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
 
 
-def upload_log(uploaded_log) -> None:
+@st.fragment(run_every=JOB_POLL_SECONDS * 2)
+def show_metrics() -> None:
     """
-    Processes and uploads a log file into the database, with its content stored in MongoDB and GridFS.
+    Shows the stage timings and counters of every app and worker process,
+    with a Prometheus text download. Only shown when metrics are enabled
+    (``MI_METRICS=1``). Fragments cannot write to ``st.sidebar``, so it is
+    called inside a ``with st.sidebar`` block.
+    """
+    snapshot = metrics.collect()
+    with st.expander("Metrics"):
+        timers_df = pd.DataFrame(
+            [
+                {
+                    "stage": name,
+                    "calls": stats["calls"],
+                    "total (s)": stats["seconds"],
+                    "mean (ms)": stats["seconds"] / stats["calls"] * 1000
+                    if stats["calls"]
+                    else 0.0,
+                    "max (ms)": stats["max_seconds"] * 1000,
+                }
+                for name, stats in sorted(snapshot["timers"].items())
+            ],
+            columns=["stage", "calls", "total (s)", "mean (ms)", "max (ms)"],
+        )
+        st.dataframe(timers_df, hide_index=True)
+        st.dataframe(pd.Series(snapshot["counters"], name="count", dtype="int64"))
+        st.download_button(
+            "Download Prometheus Metrics",
+            data=render_prometheus(snapshot),
+            file_name="mobile_insight.prom",
+            mime="text/plain",
+        )
+
+
+def show_pool_stats() -> None:
+    """
+    Shows the connection pool usage of the shared MongoDB client in the
+    sidebar, for tuning the pool size under concurrent users.
+    """
+    with st.sidebar.expander("Database Connections"):
+        st.dataframe(pd.Series(pool_stats(), name="value"))
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS * 2)
+def show_ingest_jobs() -> None:
+    """
+    Shows the ingest jobs of the last day with their stage, progress and
+    throughput, and refreshes the page when one of them finishes.
+    """
+    jobs = list(
+        db[JOBS_COLLECTION]
+        .find({"created_at": {"$gte": datetime.now() - timedelta(days=1)}})
+        .sort("created_at", -1)
+        .limit(50)
+    )
+    if not jobs:
+        return
+
+    rows = []
+    for job in jobs:
+        started_at = job.get("started_at")
+        elapsed = (
+            ((job.get("finished_at") or datetime.now()) - started_at).total_seconds()
+            if started_at
+            else 0.0
+        )
+        rows.append(
+            {
+                "filename": job["filename"],
+                "status": job["status"],
+                "records": job["records"],
+                "records/s": job["records"] / elapsed if elapsed else None,
+                "MB/s": job["size"] / elapsed / 1e6 if elapsed else None,
+                "elapsed (s)": elapsed,
+                "copied from": job.get("source"),
+                "errors": "; ".join(job.get("errors", [])),
+            }
+        )
+    st.dataframe(pd.DataFrame(rows), hide_index=True)
+
+    # Reload the file lists once a job finishes
+    finished = {
+        str(job["_id"]) for job in jobs if job["status"] in ("done", "failed")
+    }
+    seen = st.session_state.get("finished_jobs")
+    st.session_state["finished_jobs"] = finished
+    if seen is not None and finished - seen:
+        invalidate_file_list()
+        st.rerun()
+
+
+def change_msg_query_page(step: int) -> None:
+    """
+    Moves the Msg query results by ``step`` pages.
+    """
+    st.session_state["msg_query_page"] += step
+
+
+@st.fragment
+def show_msg_query(filename_list: list) -> None:
+    """
+    Shows the Msg field query panel: predicates on decoded Msg fields across
+    one or many files, the paginated matches and the query plan.
 
     Args:
-        uploaded_log: The file uploaded via Streamlit's file uploader.
+        filename_list (list): The names of the stored files.
     """
-    bytes_log = uploaded_log.getvalue()
-    log_name = uploaded_log.name
-    stats = my_analysis(bytes_log)
+    filenames = st.multiselect(
+        "Files", filename_list, default=filename_list[-1:], key="msg_query_files"
+    )
+    if not filenames:
+        st.info("Select at least one file to query.")
+        return
+
+    overviews = []
+    for filename in filenames:
+        overview = load_file_overview(filename, content_version(db, filename))
+        if overview is None:
+            forget_missing_file(filename)
+        overviews.append(overview)
+    type_ids = st.multiselect(
+        "type_id",
+        sorted({type_id for overview in overviews for type_id in overview["type_ids"]}),
+        key="msg_query_type_ids",
+    )
+    min_timestamp = min(overview["min_timestamp"] for overview in overviews)
+    max_timestamp = max(overview["max_timestamp"] for overview in overviews)
+    date_range = st.date_input(
+        "Date Range",
+        value=(pd.Timestamp(min_timestamp).date(), pd.Timestamp(max_timestamp).date()),
+        key="msg_query_date_range",
+    )
+    if len(date_range) != 2:
+        return
+
+    predicate_count = st.number_input(
+        "Predicates", min_value=1, max_value=5, value=1, key="msg_query_predicates"
+    )
+    predicates = []
+    for idx in range(predicate_count):
+        field_col, operator_col, value_col = st.columns([2, 1, 2])
+        field = field_col.text_input("Msg Field", key=f"msg_query_field_{idx}")
+        operator = operator_col.selectbox(
+            "Operator", list(OPERATORS), key=f"msg_query_operator_{idx}"
+        )
+        value = value_col.text_input(
+            "Value", key=f"msg_query_value_{idx}", disabled=operator == "exists"
+        )
+        if field:
+            predicates.append((field, operator, value))
+
+    if st.button("Run Query", disabled=not predicates):
+        start_date = datetime.combine(date_range[0], datetime.min.time())
+        end_date = datetime.combine(date_range[1], datetime.min.time())
+        fields = list(dict.fromkeys(field for field, _, _ in predicates))
+        record_field_usage(db, fields)
+        st.session_state["msg_query"] = {
+            "filenames": filenames,
+            "fields": fields,
+            "query": build_msg_query(
+                predicates, type_ids, start_date, end_date + timedelta(days=1)
+            ),
+        }
+        st.session_state["msg_query_pages"] = [(0, -1)]
+        st.session_state["msg_query_page"] = 0
 
-    if not stats.field_list:
-        st.warning("No valid fields found in the uploaded log.")
+    spec = st.session_state.get("msg_query")
+    if spec is None:
         return
 
-    log_json = stats.field_list
-    collection = db[log_name]
-
-    # Clear existing collection if it already exists
-    if log_name in db.list_collection_names():
-        collection.delete_many({})
-    collection.create_index([("type_id", 1), ("timestamp", 1), ("order", 1)])
-
-    # Process and insert log data in batches
-    batch_size = 1024
-    processed_data = []
-    for idx, entry in enumerate(log_json):
-        entry["order"] = idx
-        entry["timestamp"] = transform_datetime(entry["timestamp"])
-        if "Subpackets" in entry and isinstance(entry["Subpackets"], list):
-            for sub in entry["Subpackets"]:
-                if "SRB Ciphering Keys" in sub:
-                    sub["SRB Ciphering Keys"] = str(sub["SRB Ciphering Keys"])
-                    sub["DRB Ciphering Keys"] = str(sub["DRB Ciphering Keys"])
-        processed_data.append(entry)
-
-    # Function to insert data in chunks
-    def batch_insert(data, collection):
-        for chunk in (
-            data[i : i + batch_size] for i in range(0, len(data), batch_size)
-        ):
-            try:
-                collection.insert_many(chunk)
-            except BulkWriteError as e:
-                st.error(f"Batch insert error: {e}")
-
-    batch_insert(processed_data, collection)
-
-    # Handle GridFS for storing the log file
-    mi2log_collection = db["mi2log"]
-    existing_file = mi2log_collection.find_one({"filename": log_name})
-    if existing_file:
-        fs.delete(existing_file["data_id"])
-
-    file_id = fs.put(bytes_log, filename=log_name)
-    mi2log_collection.update_one(
-        {"filename": log_name},
-        {"$set": {"upload_time": datetime.now(), "data_id": file_id}},
-        upsert=True,
+    # Pages are read with keyset tokens, like the record table
+    pages = st.session_state["msg_query_pages"]
+    page = st.session_state["msg_query_page"]
+    try:
+        records, next_token = query_page(
+            db,
+            spec["filenames"],
+            spec["query"],
+            query_projection(spec["fields"]),
+            pages[page],
+            QUERY_PAGE_SIZE,
+        )
+    except Exception as e:
+        st.error(f"Error running query: {e}")
+        return
+    if next_token is not None and page + 1 == len(pages):
+        pages.append(next_token)
+
+    rows = [
+        {
+            "filename": record["filename"],
+            "type_id": record["type_id"],
+            "timestamp": record["timestamp"],
+            "order": record["order"],
+            **{field: record.get("Msg", {}).get(field) for field in spec["fields"]},
+        }
+        for record in records
+    ]
+    st.dataframe(pd.DataFrame(rows), hide_index=True)
+
+    previous_col, page_col, next_col = st.columns(3)
+    previous_col.button(
+        "Previous Page",
+        key="msg_query_previous",
+        on_click=change_msg_query_page,
+        args=(-1,),
+        disabled=page == 0,
+    )
+    page_col.caption(f"Page {page + 1}")
+    next_col.button(
+        "Next Page",
+        key="msg_query_next",
+        on_click=change_msg_query_page,
+        args=(1,),
+        disabled=next_token is None,
     )
 
+    if st.toggle("Show Query Plan", key="msg_query_plan"):
+        plans, summary = explain_query(db, spec["filenames"], spec["query"])
+        indexed_col, examined_col, selectivity_col = st.columns(3)
+        indexed_col.metric(
+            "Files Served by an Index",
+            f"{summary['indexed files']} / {summary['files']}",
+        )
+        examined_col.metric("Documents Examined", summary["docs examined"])
+        selectivity_col.metric("Selectivity", f"{summary['selectivity']:.1%}")
+        st.dataframe(pd.DataFrame(plans), hide_index=True)
+
 
-def create_datetime_selector() -> tuple[pd.Timestamp, pd.Timestamp]:
+def create_datetime_selector(
+    min_timestamp: datetime, max_timestamp: datetime
+) -> tuple[pd.Timestamp, pd.Timestamp]:
     """
     Create start date and end data selector.
 
+    Args:
+        min_timestamp (datetime): The earliest timestamp of the file.
+        max_timestamp (datetime): The latest timestamp of the file.
+
     Returns:
         start_date (str): The date string to transform.
         end_date (str): The format of the date string (default: '%Y-%m-%d %H:%M:%S.%f').
@@ -170,30 +625,30 @@ def create_datetime_selector() -> tuple[pd.Timestamp, pd.Timestamp]:
 
     start_date_col, start_time_col = st.columns([0.5, 1])
     start_date_selector = start_date_col.date_input(
-        "Start Date", keys_df["timestamp"].min()
+        "Start Date", min_timestamp
     )
     start_hour_col, start_minute_col, start_second_col = start_time_col.columns(3)
     start_hour_selector = start_hour_col.selectbox(
-        "Start Hour", options=hours, index=keys_df["timestamp"].min().hour
+        "Start Hour", options=hours, index=min_timestamp.hour
     )
     start_minute_selector = start_minute_col.selectbox(
-        "Start Minute", options=minutes, index=keys_df["timestamp"].min().minute
+        "Start Minute", options=minutes, index=min_timestamp.minute
     )
     start_second_selector = start_second_col.selectbox(
-        "Start Second", options=seconds, index=keys_df["timestamp"].min().second
+        "Start Second", options=seconds, index=min_timestamp.second
     )
 
     end_date_col, end_time_col = st.columns([0.5, 1])
-    end_date_selector = end_date_col.date_input("End Date", keys_df["timestamp"].max())
+    end_date_selector = end_date_col.date_input("End Date", max_timestamp)
     end_hour_col, end_minute_col, end_second_col = end_time_col.columns(3)
     end_hour_selector = end_hour_col.selectbox(
-        "End Hour", options=hours, index=keys_df["timestamp"].max().hour
+        "End Hour", options=hours, index=max_timestamp.hour
     )
     end_minute_selector = end_minute_col.selectbox(
-        "End Minute", options=minutes, index=keys_df["timestamp"].max().minute
+        "End Minute", options=minutes, index=max_timestamp.minute
     )
     end_second_selector = end_second_col.selectbox(
-        "End Second", options=seconds, index=keys_df["timestamp"].max().second + 1
+        "End Second", options=seconds, index=max_timestamp.second + 1
     )
 
     # Combine the date and time inputs for start and end time into a full datetime object
@@ -207,80 +662,157 @@ def create_datetime_selector() -> tuple[pd.Timestamp, pd.Timestamp]:
     return start_date, end_date
 
 
-@st.cache_data
-def download_json(filename: str, filter_args: dict) -> str:
+def download_json(filename: str, filter_args: dict, version: str) -> str:
     """
     Retrieves and converts filtered MongoDB data to a JSON string.
 
     Args:
         filter_args (dict): Query parameters for filtering the data.
+        version (str): The content version of the file, part of the cache key.
 
     Returns:
         str: JSON-formatted string of the filtered data.
     """
+
+    def build_json() -> str:
+        collection, base = open_records(db, filename)
+        with metrics.timer("download_json.query"):
+            filtered_data = list(
+                collection.find({**base, **filter_args}, RECORD_PROJECTION).sort(
+                    "order", 1
+                )
+            )
+        # Compact Msg fields are shown with their shownames
+        codec = open_codec(db, filename)
+        with metrics.timer("download_json.serialize"):
+            for entry in filtered_data:
+                if codec:
+                    codec.decode_record(entry)
+                entry["timestamp"] = entry["timestamp"].isoformat()
+            if len(filtered_data) == 1:
+                return json.dumps(filtered_data[0], indent=4)
+            return json.dumps(filtered_data, indent=4)
+
     try:
-        filtered_data = list(db[filename].find(filter_args, {"_id": 0}))
-        for entry in filtered_data:
-            entry["timestamp"] = entry["timestamp"].isoformat()
-        if len(filtered_data) == 1:
-            return json.dumps(filtered_data[0], indent=4)
-        return json.dumps(filtered_data, indent=4)
+        return result_cache.get_or_compute(
+            "json", filename, version, filter_args, build_json
+        )
     except Exception as e:
         st.error(f"Error downloading JSON: {e}")
         return "{}"
 
 
-@st.cache_data
-def download_mi2log(args: dict) -> bytes:
-    """
-    Returns bytes for downloading mi2log data using an external utility function.
+EXPORT_LABELS = {
+    "mi2log": "Download Filtered mi2log File",
+    "ndjson": "Download Filtered JSON",
+    "ndjson.gz": "Download Filtered JSON",
+    "parquet": "Download Filtered Parquet",
+}
 
-    Args:
-        args (dict): Arguments for filtering and processing mi2log data.
 
-    Returns:
-        bytes: Processed mi2log file content.
+@st.cache_resource
+def start_export_service() -> ExportService:
+    """
+    Starts the background export workers and the HTTP server of prepared
+    exports once per app server. The server is skipped when its address is
+    taken, e.g. by ``python export_service.py`` started separately.
     """
+    service = ExportService(get_client()[MONGO_DB_NAME])
     try:
-        return download_bytes(args)
-    except Exception as e:
-        st.error(f"Error downloading mi2log: {e}")
-        return b""
+        start_server()
+    except OSError:
+        pass
+    return service
 
-@st.fragment
-def download_filtered_data(keys_filtered_args):
-    left, mid, right = st.columns(3)
-    if left.button('Prepare Download'):
-
-        mid.download_button(
-            label="Download Filtered mi2log File",
-            data=download_mi2log(keys_filtered_args),
-            file_name="filtered_log.mi2log",
-            mime="application/octet-stream",
-        )
 
-        filtered_json_args = {
-            "timestamp": {
-                "$gte": keys_filtered_args["start_date"],
-                "$lt": keys_filtered_args["end_date"],
-            },
-        }
+def exports_pending(keys_filtered_args) -> bool:
+    """
+    Returns whether an export prepared for the current filters is still queued
+    or running.
+    """
+    prepared = st.session_state.get("exports")
+    if not prepared or prepared["args"] != keys_filtered_args:
+        return False
+    for job_id in prepared["jobs"]:
+        job = export_service.job(job_id)
+        if job and job["status"] in ("queued", "running"):
+            return True
+    return False
 
-        if keys_filtered_args["type_id"]:
-            filtered_json_args["type_id"] = {"$in": keys_filtered_args["type_id"]}
-        right.download_button(
-            label="Download Filtered JSON",
-            data=download_json(filename_selector, filtered_json_args),
-            file_name="filtered_log.json",
-            mime="application/json",
+
+def download_filtered_data(keys_filtered_args, polling: bool):
+    """
+    Prepares the filtered mi2log, JSON and Parquet exports in the background
+    and links to them once they are ready. The files are downloaded from the
+    export server, which resumes interrupted downloads.
+
+    Run as a fragment that polls every ``JOB_POLL_SECONDS`` only while
+    ``polling``, i.e. while exports are pending. Fragment runs cannot change
+    their interval, so the app is rerun once when exports are prepared or
+    all of them finished.
+    """
+    left, mid, right, parquet_col = st.columns(4)
+    compress = right.checkbox("gzip JSON", value=True)
+    prepared = st.session_state.get("exports")
+    if left.button("Prepare Download"):
+        formats = ["mi2log", "ndjson.gz" if compress else "ndjson"]
+        file_doc = db["mi2log"].find_one(
+            {"filename": keys_filtered_args["filename"]}, {"data_id": 1}
         )
+        if file_doc is None:
+            forget_missing_file(keys_filtered_args["filename"])
+        if has_artifact(file_doc["data_id"]):
+            formats.append("parquet")
+        prepared = {
+            "args": keys_filtered_args,
+            "jobs": [
+                export_service.submit(export_format, keys_filtered_args)
+                for export_format in formats
+            ],
+        }
+        st.session_state["exports"] = prepared
+    # Exports prepared for other filters are not shown
+    if not prepared or prepared["args"] != keys_filtered_args:
+        return
+
+    columns = {"mi2log": mid, "ndjson": right, "ndjson.gz": right}
+    for job_id in prepared["jobs"]:
+        job = export_service.job(job_id)
+        if job is None:
+            continue
+        column = columns.get(job["format"], parquet_col)
+        label = EXPORT_LABELS[job["format"]]
+        if job["status"] == "done":
+            column.link_button(
+                f"{label} ({job['size'] / 1e6:.1f} MB)", export_service.url(job_id)
+            )
+        elif job["status"] == "failed":
+            column.error(f"Error preparing {label}: {job['error']}")
+        elif job["status"] == "expired":
+            column.warning(f"{label} expired, prepare it again.")
+        else:
+            done = job["records"] / job["total"] if job["total"] else 0.0
+            column.progress(
+                min(done, 1.0), text=f"{label}: {job['records']:,} records"
+            )
+    if polling != exports_pending(keys_filtered_args):
+        st.rerun()
+
 
 # Initialize App
+render_start = time.perf_counter()
 screen_inner_width, screen_inner_height = initialize_app()
 INNER_HEIGHT_DELTA = 360
 
 # Initialize Database
 mongo_client, db, fs = initialize_database()
+prepare_database()
+start_ingest_workers()
+export_service = start_export_service()
+show_pool_stats()
+if metrics.enabled:
+    with st.sidebar:
+        show_metrics()
 
 # Tabs for different functionalities
 display_tab, upload_tab, manage_files_tab = st.tabs(
@@ -300,33 +832,21 @@ with upload_tab:
     )
 
     if uploaded_logs:
-        progress_text = "Uploading mi2log files..."
-        progress_bar = st.progress(0, text=progress_text)
-        start_time = time.time()
-
-        for idx, log in enumerate(uploaded_logs):
-            upload_log(log)
-            progress_percent = int((idx + 1) / len(uploaded_logs) * 100)
-            progress_bar.progress(
-                progress_percent,
-                text=f"{progress_text} ({idx + 1}/{len(uploaded_logs)})",
-            )
-            st.info(f"Successfully uploaded {log.name}")
-
-        st.success(
-            f"Finished uploading in {time.time() - start_time:.2f} seconds", icon="✅"
-        )
+        # Jobs are keyed by the upload, so a rerun never queues a file twice
+        for log in uploaded_logs:
+            submit_job(db, fs, log.name, log, key=log.file_id)
         st.session_state["file_uploader_key"] += 1
-        time.sleep(1)  # For display success message
+        invalidate_file_list()
         st.rerun()
 
+    show_ingest_jobs()
+
+# One query serves the Manage Files table and the Display file list
+file_list = load_file_list()
+
 # --- Manage Files Tab ---
 with manage_files_tab:
-    files_df = pd.DataFrame(
-        db["mi2log"]
-        .find({}, {"filename": 1, "upload_time": 1, "_id": 0})
-        .sort("upload_time", 1)
-    ).reset_index(drop=True)
+    files_df = pd.DataFrame(file_list).reset_index(drop=True)
 
     if not files_df.empty:
         files_table = st.dataframe(
@@ -344,10 +864,12 @@ with manage_files_tab:
                 )
 
                 if new_filename:
-                    db["mi2log"].update_one(
+                    file_doc = db["mi2log"].find_one_and_update(
                         {"filename": old_filename}, {"$set": {"filename": new_filename}}
                     )
-                    db[old_filename].rename(new_filename)
+                    rename_records(db, file_doc, new_filename)
+                    result_cache.invalidate(old_filename, new_filename)
+                    invalidate_file_list()
                     st.session_state["new_filename_text_input_key"] += 1
                     st.rerun()
             else:
@@ -358,31 +880,33 @@ with manage_files_tab:
                 if files_table["selection"]["rows"]:
                     for row_idx in files_table["selection"]["rows"]:
                         filename = files_df.iloc[row_idx]["filename"]
-                        file_id = db["mi2log"].find_one({"filename": filename})[
-                            "data_id"
-                        ]
-                        fs.delete(file_id)
-                        db["mi2log"].delete_one({"filename": filename})
-                        db.drop_collection(filename)
+                        file_doc = db["mi2log"].find_one_and_delete(
+                            {"filename": filename}
+                        )
+                        release_records(db, file_doc)
+                        release_blob(db, fs, file_doc["data_id"])
+                        result_cache.invalidate(filename)
+                    invalidate_file_list()
                     st.rerun()
                 else:
                     st.error("Please select at least one file to delete.")
 
         with right:
             if st.button("Delete All Files"):
-                mongo_client.drop_database("mobile_insight")
+                for file_doc in db["mi2log"].find({}, {"data_id": 1}):
+                    remove_artifact(file_doc["data_id"])
+                mongo_client.drop_database(MONGO_DB_NAME)
+                result_cache.invalidate(*files_df["filename"])
+                invalidate_file_list()
+                # The job indexes were dropped with the database
+                prepare_database.clear()
                 st.rerun()
     else:
         st.info("No records found in MongoDB.")
 
 # --- Display Tab ---
 with display_tab:
-    filename_list = [
-        doc["filename"]
-        for doc in db["mi2log"]
-        .find({}, {"filename": 1, "_id": 0})
-        .sort("upload_time", 1)
-    ]
+    filename_list = [doc["filename"] for doc in file_list]
 
     if filename_list:
         with st.popover(
@@ -392,24 +916,28 @@ with display_tab:
             filename_selector = st.selectbox(
                 "Filename", filename_list, key="filename_selector"
             )
-            keys_df = load_data(filename_selector)
+            file_version = content_version(db, filename_selector)
+            file_summary = load_file_summary(filename_selector, file_version)
+            if file_summary is None:
+                forget_missing_file(filename_selector)
+            file_overview = load_file_overview(filename_selector, file_version)
 
             # Filtering options
             type_id_selector = st.multiselect(
-                "type_id", keys_df["type_id"].unique(), []
+                "type_id", file_overview["type_ids"], []
             )
-            if type_id_selector:
-                keys_df = keys_df[keys_df["type_id"].isin(type_id_selector)]
 
             # Datetime Filtering
-            start_date, end_date = create_datetime_selector()
+            start_date, end_date = create_datetime_selector(
+                file_overview["min_timestamp"], file_overview["max_timestamp"]
+            )
 
             if start_date > end_date:
                 st.error("Start time cannot be later than end time.")
 
-            keys_df = keys_df[
-                (keys_df["timestamp"] >= start_date) & (keys_df["timestamp"] < end_date)
-            ].reset_index(drop=True)
+            records_query = {"timestamp": {"$gte": start_date, "$lt": end_date}}
+            if type_id_selector:
+                records_query["type_id"] = {"$in": type_id_selector}
 
             keys_filtered_args = {
                 "filename": filename_selector,
@@ -436,15 +964,31 @@ with display_tab:
             [left_right_ratio, 100 - left_right_ratio]
         )
         with left_column.container():
-            download_filtered_data(keys_filtered_args)
+            polling = exports_pending(keys_filtered_args)
+            st.fragment(
+                download_filtered_data,
+                run_every=JOB_POLL_SECONDS if polling else None,
+            )(keys_filtered_args, polling)
+
+        # Bucket counts of the whole file come from the summary, other ranges
+        # are aggregated by MongoDB
+        count_df = None
+        if not type_id_selector:
+            count_df = summary_histogram(
+                file_summary, start_date, end_date, timestamp_scale
+            )
+        if count_df is None:
+            count_df = load_histogram(
+                filename_selector,
+                type_id_selector,
+                start_date,
+                end_date,
+                timestamp_scale,
+                file_version,
+            )
+        # plotly is only needed once a file is displayed
+        import plotly.express as px
 
-        # Create a DataFrame for visualization
-        keys_df["timestamp_aggregate"] = keys_df["timestamp"].dt.floor(
-            f"{timestamp_scale}s"
-        )
-        timestamp_counts = keys_df["timestamp_aggregate"].value_counts().sort_index()
-        count_df = timestamp_counts.reset_index()
-        count_df.columns = ["timestamp", "count"]
         fig = px.bar(count_df, x="timestamp", y="count")
 
         num_records_col, records_chart_col = st.columns([0.1, 0.9])
@@ -453,36 +997,74 @@ with display_tab:
             'Select the bars to filter the dataframe. Click "Pan" for single selection and "Box Select" or "Lasso Select" for multiple selection. Double click the selected bars to unselect'
         )
         if timestamp_selector["selection"]["points"]:
-            keys_df = keys_df[
-                keys_df["timestamp_aggregate"].isin(
-                    [d["x"] for d in timestamp_selector.selection["points"]]
-                )
-            ].reset_index(drop=True)
-
+            bucket_size = pd.Timedelta(seconds=timestamp_scale)
+            records_query["$or"] = [
+                {
+                    "timestamp": {
+                        "$gte": pd.to_datetime(point["x"]),
+                        "$lt": pd.to_datetime(point["x"]) + bucket_size,
+                    }
+                }
+                for point in timestamp_selector.selection["points"]
+            ]
+
+        page_df, has_next_page = paginate_records(
+            filename_selector, records_query, file_version
+        )
         key_table = left_column.dataframe(
-            keys_df[["type_id", "timestamp", "order"]],
+            page_df,
             on_select="rerun",
             selection_mode="single-row",
             width=screen_inner_width // 2,
             height=screen_inner_height - INNER_HEIGHT_DELTA,
         )
-        num_records_col.metric("Number of Records", len(keys_df))
+        previous_col, page_col, next_col = left_column.columns(3)
+        previous_col.button(
+            "Previous Page",
+            on_click=change_record_page,
+            args=(-1,),
+            disabled=st.session_state["record_page"] == 0,
+        )
+        page_col.caption(f"Page {st.session_state['record_page'] + 1}")
+        next_col.button(
+            "Next Page",
+            on_click=change_record_page,
+            args=(1,),
+            disabled=not has_next_page,
+        )
+        record_count = None
+        if "$or" not in records_query:
+            record_count = summary_count(
+                file_summary, type_id_selector, start_date, end_date
+            )
+        if record_count is None:
+            record_count = count_records(filename_selector, records_query, file_version)
+        num_records_col.metric("Number of Records", record_count)
 
         if key_table["selection"]["rows"]:
-            selected_json_args = keys_df.iloc[key_table["selection"]["rows"][0]][
+            selected_json_args = page_df.iloc[key_table["selection"]["rows"][0]][
                 ["type_id", "timestamp", "order"]
             ].to_dict()
 
             right_column.download_button(
                 label="Download Selected JSON",
-                data=download_json(filename_selector, selected_json_args),
+                data=download_json(
+                    filename_selector, selected_json_args, file_version
+                ),
                 file_name="selected_log.json",
                 mime="application/json",
             )
             with right_column.container(
                 height=screen_inner_height - INNER_HEIGHT_DELTA
             ):
-                st.json(download_json(filename_selector, selected_json_args))
+                st.json(
+                    download_json(filename_selector, selected_json_args, file_version)
+                )
+
+        with st.expander("Msg Field Query"):
+            show_msg_query(filename_list)
 
     else:
         st.info("No records in MongoDB")
+
+metrics.observe("gui.render", time.perf_counter() - render_start)
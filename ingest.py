@@ -0,0 +1,747 @@
+# Standard Library Imports
+import hashlib
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+# Third-Party Library Imports
+import bson
+from gridfs import GridFS
+from pymongo import WriteConcern
+from pymongo.errors import PyMongoError
+
+# Local Imports
+from database import get_database
+from mi2log_frames import FRAME_END, FrameLocator
+from cache import result_cache
+from artifacts import ArtifactWriter, artifact_path, has_artifact, remove_artifact
+from blobs import (
+    READ_SIZE,
+    blob_size,
+    extend_blob,
+    hash_source,
+    iter_source,
+    put_blob,
+    source_size,
+)
+from storage import RecordStaging, file_encoding, record_source, release_records
+from msg_schema import file_codec
+from query import msg_index_fields
+from summary import SummaryBuilder
+from metrics import metrics
+from config import (
+    ARTIFACT_DIR,
+    INGEST_BATCH_BYTES,
+    INGEST_BATCH_SIZE,
+    INGEST_INSERT_RETRIES,
+    INGEST_QUEUE_BATCHES,
+    INGEST_RETRY_SECONDS,
+    INGEST_WORKERS,
+    INGEST_WRITE_CONCERN,
+    INGEST_WRITER_THREADS,
+)
+
+
+def bulk_write_concern(w: str = INGEST_WRITE_CONCERN):
+    """
+    Returns the write concern of record inserts, or None for the client's.
+
+    Raises:
+        ValueError: If writes would be unacknowledged, since failed batches
+            could then neither be reported nor retried.
+    """
+    if not w:
+        return None
+    w = int(w) if w.isdigit() else w
+    if w == 0:
+        raise ValueError("Record inserts need an acknowledged write concern.")
+    return WriteConcern(w=w)
+
+
+class BatchWriter:
+    """
+    Bounded sink that groups records into batches and inserts them from
+    background threads while the analyzer keeps decoding.
+
+    A batch is handed over once it holds ``batch_size`` records or, when
+    ``batch_bytes`` is set, that many BSON bytes. ``threads`` writers insert
+    batches concurrently and unordered, since every record carries its
+    ``order``. At most ``max_pending`` full batches wait in the queue; once it
+    is full, ``put`` blocks the analyzer until a writer catches up, so memory
+    use does not depend on the size of the log.
+
+    A failed batch is retried after a growing delay. Records are identified by
+    ``order`` within ``base``, so a retry only inserts the records that are not
+    stored yet and never duplicates the ones a failed call did insert.
+    """
+
+    def __init__(
+        self,
+        collection,
+        base: dict = None,
+        batch_size: int = INGEST_BATCH_SIZE,
+        batch_bytes: int = INGEST_BATCH_BYTES,
+        threads: int = INGEST_WRITER_THREADS,
+        max_pending: int = INGEST_QUEUE_BATCHES,
+        write_concern: str = INGEST_WRITE_CONCERN,
+        retries: int = INGEST_INSERT_RETRIES,
+    ):
+        concern = bulk_write_concern(write_concern)
+        if concern is not None:
+            collection = collection.with_options(write_concern=concern)
+        self.collection = collection
+        self.base = base or {}
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.retries = retries
+        self.inserted = 0
+        self.errors = []
+        self.seconds = 0.0
+        # Wall time during which at least one writer was inserting
+        self.busy_seconds = 0.0
+        self._busy_threads = 0
+        self._busy_since = 0.0
+        self._batch = []
+        self._batch_bytes = 0
+        self._started = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._threads = [
+            threading.Thread(target=self._run, daemon=True)
+            for _ in range(max(threads, 1))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def docs_per_second(self) -> float:
+        """
+        The sustained insert rate of MongoDB: the inserted records over the
+        time the writers spent inserting, leaving out the time they waited
+        for the analyzer to fill a batch.
+        """
+        return self.inserted / self.busy_seconds if self.busy_seconds else 0.0
+
+    def raise_errors(self) -> None:
+        """
+        Raises if any batch could not be inserted, so a file is never stored
+        with records missing.
+        """
+        if self.errors:
+            raise RuntimeError(
+                f"{len(self.errors)} record batch(es) could not be inserted: "
+                f"{self.errors[0]}"
+            )
+
+    def put(self, record: dict) -> None:
+        """
+        Adds a record to the current batch and hands the batch to the writer
+        threads once it is full.
+        """
+        if self.batch_bytes:
+            try:
+                size = len(bson.encode(record))
+            except Exception as e:
+                # Reported like a failed batch instead of stopping the analyzer
+                with self._lock:
+                    self.errors.append(e)
+                metrics.count("ingest.insert_errors")
+                return
+            self._batch_bytes += size
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size or (
+            self.batch_bytes and self._batch_bytes >= self.batch_bytes
+        ):
+            # Time blocked here is time the analyzer waited for MongoDB
+            with metrics.timer("ingest.queue_wait"):
+                self._enqueue(self._batch)
+            self._batch = []
+            self._batch_bytes = 0
+
+    def close(self) -> None:
+        """
+        Flushes the remaining records and waits for the writer threads to
+        finish.
+        """
+        if self._batch:
+            self._enqueue(self._batch)
+            self._batch = []
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._started is not None:
+            self.seconds = time.perf_counter() - self._started
+            metrics.observe("ingest.bulk_load", self.seconds)
+
+    def _enqueue(self, batch: list) -> None:
+        if self._started is None:
+            self._started = time.perf_counter()
+        self._queue.put(batch)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            self._busy(1)
+            try:
+                with metrics.timer("ingest.insert_many"):
+                    self._insert(batch)
+                with self._lock:
+                    self.inserted += len(batch)
+                metrics.count("ingest.records_inserted", len(batch))
+            except Exception as e:
+                # Any failure, including records BSON cannot encode, is
+                # reported and the queue kept draining, so the analyzer never
+                # blocks on a writer that stopped consuming.
+                with self._lock:
+                    self.errors.append(e)
+                metrics.count("ingest.insert_errors")
+            finally:
+                self._busy(-1)
+
+    def _busy(self, change: int) -> None:
+        """
+        Counts a writer starting (1) or finishing (-1) a batch, adding up the
+        wall time during which any writer is busy.
+        """
+        with self._lock:
+            now = time.perf_counter()
+            if self._busy_threads == 0:
+                self._busy_since = now
+            self._busy_threads += change
+            if self._busy_threads == 0:
+                self.busy_seconds += now - self._busy_since
+
+    def _insert(self, batch: list) -> None:
+        pending = batch
+        for attempt in range(self.retries + 1):
+            try:
+                if attempt:
+                    pending = self._missing(pending)
+                if pending:
+                    self.collection.insert_many(pending, ordered=False)
+                return
+            except PyMongoError:
+                if attempt == self.retries:
+                    raise
+                metrics.count("ingest.insert_retries")
+                time.sleep(INGEST_RETRY_SECONDS * 2**attempt)
+
+    def _missing(self, batch: list) -> list:
+        """
+        Returns the records of a batch that are not stored yet.
+        """
+        stored = {
+            doc["order"]
+            for doc in self.collection.find(
+                {**self.base, "order": {"$in": [record["order"] for record in batch]}},
+                {"order": 1, "_id": 0},
+            )
+        }
+        return [record for record in batch if record["order"] not in stored]
+
+
+def content_hash(bytes_log: bytes) -> str:
+    """
+    Returns the SHA-256 digest identifying the content of a log file.
+    """
+    return hashlib.sha256(bytes_log).hexdigest()
+
+
+def find_duplicate(db, sha256: str, log_name: str = None):
+    """
+    Finds a stored log with the given content, preferring ``log_name`` itself.
+
+    Returns:
+        dict: The mi2log document of the duplicate, or None.
+    """
+    mi2log_collection = db["mi2log"]
+    if log_name is not None:
+        file_doc = mi2log_collection.find_one(
+            {"filename": log_name, "sha256": sha256}
+        )
+        if file_doc:
+            return file_doc
+    return mi2log_collection.find_one({"sha256": sha256})
+
+
+def release_blob(db, fs, data_id) -> None:
+    """
+    Deletes a raw log and its artifact once no mi2log document references it.
+    Identical uploads share one blob, so it is reference counted by the files
+    pointing at it.
+    """
+    if data_id is None or db["mi2log"].find_one({"data_id": data_id}, {"_id": 1}):
+        return
+    fs.delete(data_id)
+    remove_artifact(data_id)
+
+
+def store_file_doc(db, fs, log_name: str, fields: dict) -> None:
+    """
+    Points ``log_name`` at a stored log and releases the records and blob it
+    replaces.
+    """
+    previous = db["mi2log"].find_one_and_update(
+        {"filename": log_name},
+        {"$set": {"upload_time": datetime.now(), **fields}},
+        upsert=True,
+    )
+    if previous:
+        release_records(db, previous, {**previous, **fields})
+        if previous["data_id"] != fields["data_id"]:
+            release_blob(db, fs, previous["data_id"])
+
+
+def clone_log(db, fs, source: dict, log_name: str) -> dict:
+    """
+    Stores a log whose content is already known under another name, copying
+    the decoded records on the server instead of decoding the log again. The
+    raw blob and its artifact are shared with the source, and so are its
+    records when they are stored in the time-series collection.
+
+    Args:
+        db: The MongoDB database.
+        fs: The GridFS instance used to store raw logs.
+        source (dict): The mi2log document of the identical log.
+        log_name (str): The name of the new log file.
+
+    Returns:
+        dict: The filename, the number of copied records and any errors.
+    """
+    if source.get("file_id") is not None:
+        # Time-series records are keyed by file id and shared as they are
+        fields = {"file_id": source["file_id"], "msg_encoding": file_encoding(source)}
+        records = source.get("records", 0)
+    else:
+        staging = RecordStaging(
+            db,
+            log_name,
+            "collection",
+            msg_index_fields(db),
+            file_encoding(source),
+        )
+        try:
+            with metrics.timer("ingest.clone_records"):
+                db[source["filename"]].aggregate(
+                    [{"$match": {}}, {"$out": staging.collection.name}]
+                )
+            records = staging.collection.count_documents({})
+            fields = staging.commit()
+        except Exception:
+            staging.discard()
+            raise
+
+    store_file_doc(
+        db,
+        fs,
+        log_name,
+        {
+            "data_id": source["data_id"],
+            "sha256": source["sha256"],
+            "frame_index": source.get("frame_index", False),
+            "records": records,
+            "summary": source.get("summary"),
+            **fields,
+        },
+    )
+    result_cache.invalidate(log_name)
+    metrics.count("ingest.files_cloned")
+    metrics.flush()
+    return {"filename": log_name, "records": records, "errors": []}
+
+
+def last_frame_end(source, length: int) -> int:
+    """
+    Returns the offset following the last frame terminator before ``length``
+    in bytes or a seekable file, reading it backwards.
+    """
+    end = length
+    while end > 0:
+        start = max(end - READ_SIZE, 0)
+        piece = b"".join(iter_source(source, start, end))
+        idx = piece.rfind(FRAME_END)
+        if idx >= 0:
+            return start + idx + 1
+        end = start
+    return 0
+
+
+def find_append_base(db, log_name: str, source):
+    """
+    Checks whether a log extends the content stored under the same name, as
+    when a capture that is still being recorded is uploaded again.
+
+    Args:
+        db: The MongoDB database.
+        log_name (str): The name of the log file.
+        source: The content of the log, as bytes or a seekable binary file.
+
+    Returns:
+        tuple: The mi2log document, the offset of the first frame to decode
+        (the end of the last complete stored frame) and the stored length, or
+        None if the log is not a byte-prefix extension of a stored blob.
+    """
+    file_doc = db["mi2log"].find_one({"filename": log_name})
+    if not file_doc or "sha256" not in file_doc:
+        return None
+    length = blob_size(db, file_doc["data_id"])
+    if not 0 < length < source_size(source):
+        return None
+    if hash_source(source, length) != file_doc["sha256"]:
+        return None
+    # Extending a blob shared with identical files would change them too
+    if db["mi2log"].count_documents({"data_id": file_doc["data_id"]}) > 1:
+        return None
+    return file_doc, last_frame_end(source, length), length
+
+
+def append_log(
+    db,
+    fs,
+    file_doc: dict,
+    tail: bytes,
+    tail_offset: int,
+    stored_length: int,
+    sha256: str,
+    progress=None,
+) -> dict:
+    """
+    Ingests the new tail of a log that was appended to since it was stored.
+
+    Only the tail is replayed. Its records continue the ``order`` sequence of
+    the stored records and are inserted into the file's collection, a new part
+    is added to the artifact, and the stored blob is extended in place.
+
+    Args:
+        db: The MongoDB database.
+        fs: The GridFS instance used to store raw logs.
+        file_doc (dict): The mi2log document of the stored log.
+        tail (bytes): The content of the log from ``tail_offset`` on.
+        tail_offset (int): The offset of the first frame to decode.
+        stored_length (int): The length of the stored blob.
+        sha256 (str): The digest of the whole new content.
+        progress: Optional callable receiving the stage and the number of
+            records decoded so far.
+
+    Returns:
+        dict: The filename, the number of appended records, an empty
+        ``errors`` list and the sustained insert rate ``docs_per_s``.
+
+    Raises:
+        RuntimeError: If a batch of records could not be inserted, in which
+            case the appended records are removed and the log is unchanged.
+    """
+    # The analyzer pulls in the native decoder, so it is imported on first use
+    from my_analyzer import my_analysis
+
+    log_name = file_doc["filename"]
+    data_id = file_doc["data_id"]
+    collection, base = record_source(db, file_doc)
+    # Appended records are stored with the encoding of the file
+    codec = file_codec(db, file_doc)
+    first_order = file_doc.get("records")
+    if first_order is None:
+        last = collection.find_one(base, {"order": 1}, sort=[("order", -1)])
+        first_order = last["order"] + 1 if last else 0
+    # Drop records left behind by an interrupted attempt of the same append
+    collection.delete_many({**base, "order": {"$gte": first_order}})
+
+    locator = FrameLocator(tail, base_offset=tail_offset)
+    # The part is named by the first order, so a retry replaces it
+    artifact = (
+        ArtifactWriter(artifact_path(data_id), part=first_order)
+        if has_artifact(data_id)
+        else None
+    )
+    summary = (
+        SummaryBuilder.from_summary(file_doc["summary"])
+        if file_doc.get("summary")
+        else None
+    )
+
+    try:
+        with BatchWriter(collection, base) as writer:
+
+            def sink(record):
+                locator.annotate(record)
+                if artifact:
+                    artifact.append(record)
+                if summary:
+                    summary.add(record)
+                if codec:
+                    codec.encode_record(record)
+                record.update(base)
+                writer.put(record)
+                if progress and record["order"] % INGEST_BATCH_SIZE == 0:
+                    progress("parsing", record["order"] - first_order)
+
+            stats = my_analysis(tail, sink=sink, first_order=first_order)
+            if progress:
+                progress("inserting", stats.record_count)
+        writer.raise_errors()
+        if artifact:
+            artifact.close()
+    except Exception:
+        collection.delete_many({**base, "order": {"$gte": first_order}})
+        if artifact:
+            artifact.discard()
+        raise
+
+    with metrics.timer("ingest.gridfs_extend"):
+        extend_blob(
+            db, data_id, tail[stored_length - tail_offset :], sha256, stored_length
+        )
+    db["mi2log"].update_one(
+        {"_id": file_doc["_id"]},
+        {
+            "$set": {
+                "upload_time": datetime.now(),
+                "sha256": sha256,
+                "frame_index": file_doc.get("frame_index", False)
+                and locator.complete,
+                "records": first_order + stats.record_count,
+                "summary": summary.build() if summary else None,
+            }
+        },
+    )
+    result_cache.invalidate(log_name)
+    metrics.count("ingest.files_appended")
+    metrics.flush()
+    return {
+        "filename": log_name,
+        "records": stats.record_count,
+        "errors": [],
+        "docs_per_s": writer.docs_per_second,
+    }
+
+
+def ingest_log(
+    db, fs, log_name: str, bytes_log: bytes, data_id=None, progress=None
+) -> dict:
+    """
+    Decodes a mi2log file and streams its records into MongoDB, then stores the
+    raw log in GridFS.
+
+    Records are written into a staging area (see ``RecordStaging``) which
+    replaces the file's records only once decoding has finished, so a re-upload
+    keeps the old records visible until the new ones are complete. A summary of
+    the records (see ``SummaryBuilder``) is stored on the file's mi2log document.
+
+    Args:
+        db: The MongoDB database.
+        fs: The GridFS instance used to store raw logs.
+        log_name (str): The name of the log file.
+        bytes_log (bytes): The content of the log file.
+        data_id: The GridFS id of the log if it is already stored.
+        progress: Optional callable receiving the stage (``"parsing"`` or
+            ``"inserting"``) and the number of records decoded so far.
+
+    Returns:
+        dict: The filename, the number of decoded records, an empty
+        ``errors`` list and the sustained insert rate ``docs_per_s``.
+
+    Raises:
+        RuntimeError: If a batch of records could not be inserted, in which
+            case nothing is stored, so an upload of the same content is
+            ingested again instead of being taken for a duplicate.
+    """
+    from my_analyzer import my_analysis
+
+    staging = RecordStaging(db, log_name, msg_fields=msg_index_fields(db))
+
+    # Each record remembers the byte range of its frame for indexed exports
+    locator = FrameLocator(bytes_log)
+    summary = SummaryBuilder()
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    staging_artifact = tempfile.mkdtemp(prefix="_ingest.", dir=ARTIFACT_DIR)
+
+    try:
+        # Covers decoding and waiting for the last batches to be inserted
+        with metrics.timer("ingest.decode_insert"), BatchWriter(
+            staging.collection, staging.fields
+        ) as writer, ArtifactWriter(staging_artifact) as artifact:
+
+            def sink(record):
+                locator.annotate(record)
+                artifact.append(record)
+                summary.add(record)
+                writer.put(staging.prepare(record))
+                if progress and record["order"] % INGEST_BATCH_SIZE == 0:
+                    progress("parsing", record["order"])
+
+            stats = my_analysis(bytes_log, sink=sink)
+            if progress:
+                progress("inserting", stats.record_count)
+        writer.raise_errors()
+    except Exception:
+        staging.discard()
+        shutil.rmtree(staging_artifact, ignore_errors=True)
+        raise
+
+    result = {
+        "filename": log_name,
+        "records": stats.record_count,
+        "errors": [],
+        "docs_per_s": writer.docs_per_second,
+    }
+    if not stats.record_count:
+        staging.discard()
+        shutil.rmtree(staging_artifact, ignore_errors=True)
+        return result
+
+    with metrics.timer("ingest.commit"):
+        fields = staging.commit()
+
+    # Handle GridFS for storing the log file
+    file_id = data_id
+    if file_id is None:
+        with metrics.timer("ingest.gridfs_put"):
+            blob = put_blob(fs, bytes_log, log_name)
+        file_id, sha256 = blob["data_id"], blob["sha256"]
+    else:
+        sha256 = content_hash(bytes_log)
+
+    # A retried job finds the artifact of its earlier attempt in place
+    remove_artifact(file_id)
+    os.replace(staging_artifact, artifact_path(file_id))
+    store_file_doc(
+        db,
+        fs,
+        log_name,
+        {
+            "data_id": file_id,
+            "sha256": sha256,
+            "frame_index": locator.complete,
+            "records": stats.record_count,
+            "summary": summary.build(),
+            **fields,
+        },
+    )
+    # Invalidated once the file document points at the new content, so no
+    # result of the old content is cached again under the new version
+    result_cache.invalidate(log_name)
+    metrics.count("ingest.files")
+    metrics.flush()
+    return result
+
+
+def ingest_file(log_name: str, bytes_log: bytes) -> dict:
+    """
+    Process pool entry point: ingests one log file using the shared MongoDB
+    client of the spawned worker. Content that is
+    already stored is copied from the identical log, or skipped when it is
+    stored under the same name; a log that extends its stored content only
+    has its new tail ingested.
+
+    Args:
+        log_name (str): The name of the log file.
+        bytes_log (bytes): The content of the log file.
+
+    Returns:
+        dict: The result of ``ingest_log``.
+    """
+    db = get_database()
+    fs = GridFS(db)
+    sha256 = content_hash(bytes_log)
+    duplicate = find_duplicate(db, sha256, log_name)
+    if duplicate is None:
+        base = find_append_base(db, log_name, bytes_log)
+        if base is None:
+            return ingest_log(db, fs, log_name, bytes_log)
+        file_doc, tail_offset, stored_length = base
+        return append_log(
+            db,
+            fs,
+            file_doc,
+            bytes_log[tail_offset:],
+            tail_offset,
+            stored_length,
+            sha256,
+        )
+    if duplicate["filename"] == log_name:
+        records = duplicate.get("records", 0)
+        return {"filename": log_name, "records": records, "errors": []}
+    return clone_log(db, fs, duplicate, log_name)
+
+
+def ingest_path(log_name: str, path: str) -> dict:
+    """
+    Process pool entry point: reads a log file from disk and ingests it with
+    ``ingest_file``, timing the whole file.
+
+    Returns:
+        dict: The result of ``ingest_file`` with the file size in ``bytes`` and
+        the elapsed ``seconds``.
+    """
+    start = time.perf_counter()
+    with open(path, "rb") as log_file:
+        bytes_log = log_file.read()
+    result = ingest_file(log_name, bytes_log)
+    result["bytes"] = len(bytes_log)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def ingest_files(logs: list, max_workers: int = INGEST_WORKERS):
+    """
+    Ingests several log files from disk in parallel, one worker process per
+    file; each worker reads its own file, so the batch is never held in memory.
+
+    A file that fails to decode or insert is reported through its error and
+    does not stop the rest of the batch. Files sharing a name would overwrite
+    each other's stored log, so none of them is ingested and each is reported
+    as failed.
+
+    Args:
+        logs (list): ``(log_name, path)`` pairs.
+        max_workers (int): Maximum number of worker processes.
+
+    Yields:
+        tuple: ``(log_name, result, error)``, one per pair, in completion
+        order, where exactly one of ``result`` and ``error`` is set.
+    """
+    paths = {}
+    for log_name, path in logs:
+        paths.setdefault(log_name, []).append(path)
+    logs = {}
+    for log_name, same_name in paths.items():
+        if len(same_name) == 1:
+            logs[log_name] = same_name[0]
+            continue
+        for path in same_name:
+            yield log_name, None, ValueError(
+                f"{path} has the same name as {len(same_name) - 1} other "
+                "file(s) of the batch"
+            )
+    if not logs:
+        return
+
+    # pymongo clients are not fork-safe, so workers are spawned fresh.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=min(max_workers, len(logs)), mp_context=context
+    ) as pool:
+        futures = {
+            pool.submit(ingest_path, log_name, path): log_name
+            for log_name, path in logs.items()
+        }
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
@@ -0,0 +1,357 @@
+"""
+Persistent ingest job queue.
+
+Uploads are stored in GridFS and recorded as jobs in the ``ingest_jobs``
+collection; worker processes started with
+
+    python jobs.py --workers 4
+
+claim queued jobs and ingest them independently of any Streamlit session.
+"""
+
+# Standard Library Imports
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Third-Party Library Imports
+from gridfs import GridFS
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Local Imports
+from database import get_database
+from blobs import hash_source, put_blob, read_blob, source_size
+from ingest import (
+    append_log,
+    clone_log,
+    find_append_base,
+    find_duplicate,
+    ingest_log,
+    release_blob,
+)
+from metrics import metrics
+from config import INGEST_WORKERS, JOB_LEASE_SECONDS, JOB_POLL_SECONDS
+
+JOBS_COLLECTION = "ingest_jobs"
+
+
+def ensure_job_indexes(db) -> None:
+    """
+    Creates the indexes of the job collection and the content hash index used
+    to deduplicate uploads.
+    """
+    jobs = db[JOBS_COLLECTION]
+    jobs.create_index("key", unique=True)
+    jobs.create_index([("status", 1), ("created_at", 1)])
+    db["mi2log"].create_index("sha256")
+
+
+def submit_job(db, fs, log_name: str, upload, key: str):
+    """
+    Stores an uploaded log in GridFS and queues it for ingest.
+
+    Submitting the same ``key`` again (e.g. on a Streamlit rerun) returns the
+    existing job instead of queueing a duplicate. Uploads are identified by
+    their SHA-256 digest: content already stored under the same name is left
+    as is, and content stored under another name is queued to be copied from
+    that file, sharing its blob instead of storing and decoding it again. When
+    the upload extends the content stored under the same name, only its new
+    tail is stored and queued to be appended. The upload is read in pieces and
+    stored compressed (see ``put_blob``), without copying it as a whole.
+
+    Args:
+        db: The MongoDB database.
+        fs: The GridFS instance used to store raw logs.
+        log_name (str): The name of the log file.
+        upload: The content of the log file, as bytes or a seekable binary
+            file such as a Streamlit ``UploadedFile``.
+        key (str): Idempotency key of the upload.
+
+    Returns:
+        ObjectId: The id of the job.
+    """
+    jobs = db[JOBS_COLLECTION]
+    existing = jobs.find_one({"key": key}, {"_id": 1})
+    if existing:
+        return existing["_id"]
+
+    with metrics.timer("upload.hash"):
+        sha256 = hash_source(upload)
+    size = source_size(upload)
+    duplicate = find_duplicate(db, sha256, log_name)
+    now = datetime.now()
+    job = {
+        "key": key,
+        "filename": log_name,
+        "sha256": sha256,
+        "size": size,
+        "status": "queued",
+        "records": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+    base = find_append_base(db, log_name, upload) if duplicate is None else None
+    if base is not None:
+        file_doc, tail_offset, stored_length = base
+        with metrics.timer("upload.gridfs_put"):
+            tail = put_blob(fs, upload, log_name, start=tail_offset)
+        job["data_id"] = tail["data_id"]
+        job["append"] = {
+            "data_id": file_doc["data_id"],
+            "sha256": file_doc["sha256"],
+            "offset": tail_offset,
+            "length": stored_length,
+        }
+    elif duplicate is None:
+        with metrics.timer("upload.gridfs_put"):
+            job["data_id"] = put_blob(fs, upload, log_name)["data_id"]
+    elif duplicate["filename"] == log_name:
+        job.update(
+            data_id=duplicate["data_id"],
+            source=log_name,
+            status="unchanged",
+            records=duplicate.get("records", 0),
+            finished_at=now,
+        )
+    else:
+        job.update(data_id=duplicate["data_id"], source=duplicate["filename"])
+
+    metrics.count("upload.files")
+    metrics.count("upload.bytes", size)
+    try:
+        return jobs.insert_one(job).inserted_id
+    except DuplicateKeyError:
+        release_blob(db, fs, job["data_id"])
+        return jobs.find_one({"key": key}, {"_id": 1})["_id"]
+
+
+def claim_job(db, worker: str):
+    """
+    Atomically takes the oldest queued job, or a running job whose worker
+    stopped renewing its lease.
+
+    Returns:
+        dict: The claimed job, or None if there is nothing to do.
+    """
+    now = datetime.now()
+    return db[JOBS_COLLECTION].find_one_and_update(
+        {
+            "$or": [
+                {"status": "queued"},
+                {
+                    "status": {"$in": ["parsing", "inserting", "copying"]},
+                    "lease_until": {"$lt": now},
+                },
+            ]
+        },
+        {
+            "$set": {
+                "status": "parsing",
+                "worker": worker,
+                "records": 0,
+                "started_at": now,
+                "updated_at": now,
+                "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            }
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def update_job(db, job: dict, worker: str, fields: dict) -> None:
+    """
+    Updates a job and renews its lease, as long as ``worker`` still owns it.
+    """
+    now = datetime.now()
+    db[JOBS_COLLECTION].update_one(
+        {"_id": job["_id"], "worker": worker},
+        {
+            "$set": {
+                **fields,
+                "updated_at": now,
+                "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            }
+        },
+    )
+
+
+def copy_job(db, fs, job: dict, worker: str) -> dict:
+    """
+    Stores a duplicate upload by copying the records of the identical log.
+
+    The source is looked up again by content hash, since it may have been
+    renamed or deleted while the job was queued.
+    """
+    update_job(db, job, worker, {"status": "copying"})
+    source = find_duplicate(db, job["sha256"], job["filename"])
+    if source is None:
+        return {
+            "records": 0,
+            "errors": ["The identical log was deleted before it could be copied."],
+        }
+    if source["filename"] == job["filename"]:
+        return {"records": source.get("records", 0), "errors": []}
+    job["data_id"] = source["data_id"]
+    return clone_log(db, fs, source, job["filename"])
+
+
+def append_job(db, fs, job: dict, progress) -> dict:
+    """
+    Appends the stored tail of a job to the log it extends, as long as that
+    log has not changed since the job was queued. A job whose append was
+    already applied, by an attempt that lost its lease before finishing the
+    job, is done.
+    """
+    base = job["append"]
+    if db["mi2log"].find_one(
+        {
+            "filename": job["filename"],
+            "data_id": base["data_id"],
+            "sha256": job["sha256"],
+        },
+        {"_id": 1},
+    ):
+        return {"records": 0, "errors": []}
+    file_doc = db["mi2log"].find_one(
+        {
+            "filename": job["filename"],
+            "data_id": base["data_id"],
+            "sha256": base["sha256"],
+        }
+    )
+    if file_doc is None:
+        return {
+            "records": 0,
+            "errors": ["The stored log changed before the append could be applied."],
+        }
+    tail = read_blob(fs, job["data_id"])
+    return append_log(
+        db,
+        fs,
+        file_doc,
+        tail,
+        base["offset"],
+        base["length"],
+        job["sha256"],
+        progress,
+    )
+
+
+def run_job(db, fs, job: dict, worker: str) -> None:
+    """
+    Ingests a claimed job, reporting its stage and progress. Jobs with a
+    ``source`` copy the records of the identical stored log instead, and jobs
+    with an ``append`` base only ingest the tail of the log.
+    """
+    # Renew the lease while the job runs so no other worker reclaims it
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(JOB_LEASE_SECONDS / 3):
+            update_job(db, job, worker, {})
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+
+    last_update = 0.0
+
+    def progress(stage, records):
+        nonlocal last_update
+        if stage != "parsing" or time.monotonic() - last_update >= JOB_POLL_SECONDS:
+            last_update = time.monotonic()
+            update_job(db, job, worker, {"status": stage, "records": records})
+
+    try:
+        with metrics.timer("jobs.run"):
+            if job.get("source"):
+                result = copy_job(db, fs, job, worker)
+            elif job.get("append"):
+                result = append_job(db, fs, job, progress)
+            else:
+                with metrics.timer("jobs.gridfs_read"):
+                    bytes_log = read_blob(fs, job["data_id"])
+                result = ingest_log(
+                    db, fs, job["filename"], bytes_log, job["data_id"], progress
+                )
+        # An append may only add bytes of a frame that is not complete yet
+        if not result["records"] and not job.get("append"):
+            result["errors"].append("No valid fields found in the uploaded log.")
+    except Exception as e:
+        result = {"records": 0, "errors": [str(e)]}
+    finally:
+        stop.set()
+
+    # The tail blob of an append is released once it has been appended
+    stored_id = job["append"]["data_id"] if job.get("append") else job["data_id"]
+    stored = db["mi2log"].find_one({"data_id": stored_id}, {"_id": 1})
+    release_blob(db, fs, job["data_id"])
+    status = "done" if stored and not result["errors"] else "failed"
+    update_job(
+        db,
+        job,
+        worker,
+        {
+            "status": status,
+            "records": result["records"],
+            "errors": result["errors"],
+            "finished_at": datetime.now(),
+        },
+    )
+    metrics.count(f"jobs.{status}")
+    metrics.flush()
+
+
+def run_worker(poll_interval: float = JOB_POLL_SECONDS) -> None:
+    """
+    Processes queued jobs until the process is stopped.
+    """
+    db = get_database()
+    fs = GridFS(db)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    ensure_job_indexes(db)
+    while True:
+        job = claim_job(db, worker)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(db, fs, job, worker)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run mi2log ingest workers.")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, daemon=True) for _ in range(args.workers)
+    ]
+
+    # Stopping the parent stops the workers; their claimed jobs are taken over
+    # by other workers once the leases expire
+    def stop(signum, frame):
+        for process in processes:
+            if process.pid is not None:
+                process.terminate()
+        for process in processes:
+            if process.pid is not None:
+                process.join()
+        sys.exit(128 + signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
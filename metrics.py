@@ -0,0 +1,196 @@
+"""
+Stage timers and counters of ingest, queries and exports.
+
+Instrumentation is off unless ``MI_METRICS=1``; ``timer`` then returns a
+shared no-op context manager and ``count`` returns immediately. Each process
+writes its metrics to its own file in ``METRICS_DIR`` when ``flush`` is
+called; the admin panel of the app and
+
+    python metrics.py --output /var/lib/node_exporter/mobile_insight.prom
+
+merge the files of every process and render them as Prometheus text.
+"""
+
+# Standard Library Imports
+import argparse
+import glob
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import nullcontext
+
+# Local Imports
+from config import METRICS_DIR, METRICS_ENABLED
+
+PROMETHEUS_PREFIX = "mobile_insight"
+
+_NULL_TIMER = nullcontext()
+
+
+class _Timer:
+    def __init__(self, metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """
+    Accumulates, per stage, the number of calls and their total and maximum
+    duration, plus named counters.
+    """
+
+    def __init__(
+        self, enabled: bool = METRICS_ENABLED, directory: str = METRICS_DIR
+    ):
+        self.enabled = enabled
+        self.directory = directory
+        self.path = os.path.join(
+            directory, f"{socket.gethostname()}-{os.getpid()}.json"
+        )
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+
+    def timer(self, name: str):
+        """
+        Returns a context manager timing its block as stage ``name``.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def observe(self, name: str, seconds: float, calls: int = 1) -> None:
+        """
+        Adds ``calls`` calls taking ``seconds`` in total to stage ``name``.
+        Calls added at once count towards the maximum with their mean.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._timers.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += calls
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds / calls if calls else 0.0)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Increments counter ``name``.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        """
+        Returns the metrics of this process.
+        """
+        with self._lock:
+            return {
+                "timers": {
+                    name: {"calls": calls, "seconds": seconds, "max_seconds": peak}
+                    for name, (calls, seconds, peak) in self._timers.items()
+                },
+                "counters": dict(self._counters),
+            }
+
+    def flush(self) -> None:
+        """
+        Writes the metrics of this process to its file in the metrics
+        directory.
+        """
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        partial_path = f"{self.path}.part"
+        with open(partial_path, "w", encoding="utf-8") as out:
+            json.dump(self.snapshot(), out)
+        os.replace(partial_path, self.path)
+
+    def collect(self) -> dict:
+        """
+        Merges the metrics written by every process with the live metrics of
+        this one.
+        """
+        snapshots = [self.snapshot()]
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            if path == self.path:
+                continue
+            try:
+                with open(path, encoding="utf-8") as metrics_file:
+                    snapshots.append(json.load(metrics_file))
+            except (OSError, ValueError):
+                continue
+        return merge(snapshots)
+
+
+def merge(snapshots: list) -> dict:
+    """
+    Sums the calls, seconds and counters of several snapshots.
+    """
+    merged = {"timers": {}, "counters": {}}
+    for snapshot in snapshots:
+        for name, stats in snapshot["timers"].items():
+            total = merged["timers"].setdefault(
+                name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0}
+            )
+            total["calls"] += stats["calls"]
+            total["seconds"] += stats["seconds"]
+            total["max_seconds"] = max(total["max_seconds"], stats["max_seconds"])
+        for name, value in snapshot["counters"].items():
+            merged["counters"][name] = merged["counters"].get(name, 0) + value
+    return merged
+
+
+def render_prometheus(snapshot: dict) -> str:
+    """
+    Renders a snapshot in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric, key, kind in (
+        ("stage_calls_total", "calls", "counter"),
+        ("stage_seconds_total", "seconds", "counter"),
+        ("stage_seconds_max", "max_seconds", "gauge"),
+    ):
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{metric} {kind}")
+        for name, stats in sorted(snapshot["timers"].items()):
+            lines.append(
+                f'{PROMETHEUS_PREFIX}_{metric}{{stage="{name}"}} {stats[key]}'
+            )
+    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_events_total counter")
+    for name, value in sorted(snapshot["counters"].items()):
+        lines.append(f'{PROMETHEUS_PREFIX}_events_total{{name="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Print the merged metrics of all app processes."
+    )
+    parser.add_argument("--output", help="write to this file instead of stdout")
+    args = parser.parse_args()
+
+    text = render_prometheus(metrics.collect())
+    if args.output is None:
+        print(text, end="")
+        return
+    partial_path = f"{args.output}.part"
+    with open(partial_path, "w", encoding="utf-8") as out:
+        out.write(text)
+    os.replace(partial_path, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# Standard Library Imports
+import io
+import struct
+from collections import deque
+from datetime import datetime, timedelta
+
+# Local Imports
+from config import FRAME_LOOKAHEAD
+
+# mi2log files are a stream of HDLC frames, each terminated by 0x7E, in which
+# 0x7D escapes the following byte (XOR 0x20).
+FRAME_END = 0x7E
+ESCAPE = 0x7D
+
+# DIAG log packet: cmd_code (0x10), more, length, then the log header
+# (length, log code, timestamp).
+LOG_CMD_CODE = 0x10
+LOG_HEADER = struct.Struct("<BBHHHQ")
+
+# QCDM timestamps count 1/52428800 s since the GPS epoch.
+QCDM_EPOCH = datetime(1980, 1, 6)
+QCDM_TICKS_PER_SECOND = 52428800.0
+QCDM_TICKS_PER_USECOND = QCDM_TICKS_PER_SECOND / 1.0e6
+
+
+def iter_frames(blob: bytes):
+    """
+    Splits a mi2log blob into its HDLC frames.
+
+    Args:
+        blob (bytes): The content of a mi2log file.
+
+    Yields:
+        tuple: ``(offset, length)`` of each frame, including its terminator.
+    """
+    start = 0
+    while True:
+        end = blob.find(FRAME_END, start)
+        if end < 0:
+            return
+        if end > start:
+            yield start, end + 1 - start
+        start = end + 1
+
+
+def unescape(frame: bytes, size: int) -> bytes:
+    """
+    Returns the first ``size`` unescaped bytes of an HDLC frame.
+    """
+    if ESCAPE not in frame[: size * 2]:
+        return frame[:size]
+    out = bytearray()
+    it = iter(frame)
+    for byte in it:
+        if len(out) == size:
+            break
+        out.append(next(it, 0) ^ 0x20 if byte == ESCAPE else byte)
+    return bytes(out)
+
+
+def qcdm_timestamp(ticks: int) -> datetime:
+    """
+    Converts a QCDM timestamp the same way the mobile_insight decoder does, so
+    that frame and record timestamps compare equal.
+    """
+    seconds = int(ticks / QCDM_TICKS_PER_SECOND)
+    useconds = int(ticks / QCDM_TICKS_PER_USECOND - seconds * 1.0e6)
+    return QCDM_EPOCH + timedelta(seconds=seconds, microseconds=useconds)
+
+
+def frame_header(blob: bytes, offset: int, length: int):
+    """
+    Reads the DIAG log header of a frame.
+
+    Returns:
+        tuple: The log message lengths and timestamp, or None if the frame is
+        not a log packet.
+    """
+    frame = blob[offset : offset + min(length, LOG_HEADER.size * 2)]
+    header = unescape(frame, LOG_HEADER.size)
+    if len(header) < LOG_HEADER.size or header[0] != LOG_CMD_CODE:
+        return None
+    _, _, outer_len, inner_len, _, ticks = LOG_HEADER.unpack(header)
+    return (outer_len, inner_len), qcdm_timestamp(ticks)
+
+
+class FrameLocator:
+    """
+    Assigns each decoded record the byte range of the frame it came from.
+
+    Records arrive in file order, so frames are matched by walking forward and
+    comparing the log header timestamp and length with the record's. Frames
+    that did not produce a record (non-log packets, unsupported types) are
+    skipped. If a record has no match within ``lookahead`` frames it is left
+    without a range and the index is marked incomplete.
+    """
+
+    def __init__(
+        self, blob: bytes, base_offset: int = 0, lookahead: int = FRAME_LOOKAHEAD
+    ):
+        self.blob = blob
+        self.base_offset = base_offset
+        self.lookahead = lookahead
+        self.complete = True
+        self._frames = iter_frames(blob)
+        # Frames read ahead but not matched yet, at most ``lookahead`` of them
+        self._pending = deque()
+
+    def annotate(self, record: dict) -> dict:
+        """
+        Adds ``offset`` and ``length`` to a normalized record when its frame is
+        found.
+        """
+        for idx in range(self.lookahead):
+            if idx == len(self._pending):
+                frame = next(self._frames, None)
+                if frame is None:
+                    break
+                self._pending.append(frame)
+            offset, length = self._pending[idx]
+            header = frame_header(self.blob, offset, length)
+            if header is None:
+                continue
+            msg_lens, timestamp = header
+            if timestamp == record["timestamp"] and record.get(
+                "log_msg_len", msg_lens[0]
+            ) in msg_lens:
+                record["offset"] = self.base_offset + offset
+                record["length"] = length
+                for _ in range(idx + 1):
+                    self._pending.popleft()
+                return record
+        self.complete = False
+        return record
+
+
+def coalesce(ranges, max_length: int = None):
+    """
+    Merges adjacent ``(offset, length)`` ranges into contiguous reads of at
+    most ``max_length`` bytes (unless a single range is longer), yielding each
+    read as soon as it is complete so the ranges are consumed lazily.
+    """
+    current = None
+    for offset, length in ranges:
+        if (
+            current
+            and current[0] + current[1] == offset
+            and (max_length is None or current[1] + length <= max_length)
+        ):
+            current[1] += length
+            continue
+        if current:
+            yield tuple(current)
+        current = [offset, length]
+    if current:
+        yield tuple(current)
+
+
+def copy_frames(grid_out, ranges, out, piece_size: int = 1024 * 1024) -> int:
+    """
+    Copies the given frames out of a stored mi2log file into a binary file,
+    seeking past the bytes that are not exported and reading adjacent frames
+    together in pieces of at most ``piece_size`` bytes.
+
+    Args:
+        grid_out: A seekable stored log, see ``blobs.open_blob``.
+        ranges: ``(offset, length)`` pairs in file order.
+        out: The binary file written to.
+
+    Returns:
+        int: The number of bytes written.
+    """
+    written = 0
+    for offset, length in coalesce(ranges, piece_size):
+        grid_out.seek(offset)
+        while length > 0:
+            piece = grid_out.read(min(length, piece_size))
+            if not piece:
+                break
+            out.write(piece)
+            written += len(piece)
+            length -= len(piece)
+    return written
+
+
+def read_frames(grid_out, ranges) -> bytes:
+    """
+    Reads the given frames out of a stored mi2log file, see ``copy_frames``.
+
+    Returns:
+        bytes: The concatenated frames, a valid mi2log file.
+    """
+    output = io.BytesIO()
+    copy_frames(grid_out, ranges, output)
+    return output.getvalue()
@@ -0,0 +1,144 @@
+"""
+Compact storage of decoded Msg fields.
+
+Msg shownames are long and repeat on every record of a type_id. Logs ingested
+with ``MSG_ENCODING = "compact"`` store each Msg field under a short key from
+the ``msg_schema`` registry instead, and their mi2log document is marked with
+``msg_encoding: "compact"``. Keys are shared by all type_ids, so a field has
+one key in every file and Msg queries and indexes translate one to one.
+Readers decode records back to shownames, so plain and compact files coexist.
+"""
+
+# Third-Party Library Imports
+from pymongo.errors import DuplicateKeyError
+
+SCHEMA_COLLECTION = "msg_schema"
+
+KEY_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def short_key(number: int) -> str:
+    """
+    Returns the base-36 key of the ``number``-th registered field.
+    """
+    key = ""
+    while True:
+        number, digit = divmod(number, len(KEY_DIGITS))
+        key = KEY_DIGITS[digit] + key
+        if not number:
+            return key
+
+
+class MsgCodec:
+    """
+    Translates Msg fields between shownames and registry keys.
+
+    The registry is loaded once per codec; a codec is created per ingest,
+    export or query, so it never outlives a reset of the database.
+    """
+
+    def __init__(self, db):
+        self.registry = db[SCHEMA_COLLECTION]
+        self.registry.create_index("key", unique=True)
+        self._reload()
+
+    def _reload(self) -> None:
+        self._keys = {doc["_id"]: doc["key"] for doc in self.registry.find()}
+        self._names = {key: name for name, key in self._keys.items()}
+
+    def register(self, showname: str) -> str:
+        """
+        Returns the key of a showname, registering it if it is new.
+        """
+        key = self._keys.get(showname)
+        if key is not None:
+            return key
+        while True:
+            existing = self.registry.find_one({"_id": showname})
+            if existing is not None:
+                key = existing["key"]
+                break
+            key = short_key(self.registry.count_documents({}))
+            try:
+                self.registry.insert_one({"_id": showname, "key": key})
+                break
+            except DuplicateKeyError:
+                # Another worker registered the showname or took the key
+                continue
+        self._keys[showname] = key
+        self._names[key] = showname
+        return key
+
+    def path(self, showname: str) -> str:
+        """
+        Returns the stored path of a Msg field for queries. A field that was
+        never registered gets a path no compact record has.
+        """
+        key = self._keys.get(showname)
+        if key is None:
+            self._reload()
+            key = self._keys.get(showname, f"~{showname}")
+        return f"Msg.{key}"
+
+    def encode(self, msg: dict) -> dict:
+        """
+        Replaces the shownames of a Msg dict with their keys.
+        """
+        return {self.register(name): value for name, value in msg.items()}
+
+    def encode_record(self, record: dict) -> dict:
+        """
+        Encodes the Msg dict of a decoded record in place.
+        """
+        if isinstance(record.get("Msg"), dict):
+            record["Msg"] = self.encode(record["Msg"])
+        return record
+
+    def decode(self, msg: dict) -> dict:
+        """
+        Replaces the keys of a stored Msg dict with their shownames.
+        """
+        if any(key not in self._names for key in msg):
+            self._reload()
+        return {self._names.get(key, key): value for key, value in msg.items()}
+
+    def decode_record(self, record: dict) -> dict:
+        """
+        Decodes the Msg dict of a stored record in place.
+        """
+        if isinstance(record.get("Msg"), dict):
+            record["Msg"] = self.decode(record["Msg"])
+        return record
+
+    def translate(self, spec):
+        """
+        Rewrites the ``Msg.<showname>`` keys of a query or projection.
+        """
+        if isinstance(spec, list):
+            return [self.translate(item) for item in spec]
+        if not isinstance(spec, dict):
+            return spec
+        translated = {}
+        for key, value in spec.items():
+            if key.startswith("Msg."):
+                key = self.path(key[len("Msg.") :])
+            translated[key] = self.translate(value)
+        return translated
+
+
+def file_codec(db, file_doc: dict, codec: MsgCodec = None):
+    """
+    Returns the codec of a stored log, or None if its Msg fields are stored
+    plain. ``codec`` is reused when given, e.g. across the files of a query.
+    """
+    if file_doc and file_doc.get("msg_encoding") == "compact":
+        return codec or MsgCodec(db)
+    return None
+
+
+def open_codec(db, filename: str, codec: MsgCodec = None):
+    """
+    Returns the codec of a stored log by name, see ``file_codec``.
+    """
+    file_doc = db["mi2log"].find_one({"filename": filename}, {"msg_encoding": 1})
+    return file_codec(db, file_doc, codec)
@@ -1,9 +1,10 @@
 import json
-from pymongo import MongoClient
+import time
+from datetime import datetime
+from functools import lru_cache
+from xml.parsers import expat
 from gridfs import GridFS
 
-import numpy as np
-
 try:
     import xml.etree.cElementTree as ET
 except ImportError:
@@ -12,19 +13,160 @@ except ImportError:
 from mobile_insight.analyzer.analyzer import *
 from mobile_insight.monitor import OfflineReplayer
 
+from blobs import open_blob, read_blob
+from config import LEGACY_DECODE, SHOWNAME_CACHE_SIZE
+from database import get_client, get_database
+from metrics import metrics
+from mi2log_frames import read_frames
+from storage import record_source
+
+
+@lru_cache(maxsize=SHOWNAME_CACHE_SIZE)
+def normalize_showname(showname):
+    """
+    Strips the non-alphabetic prefix (tree indentation, bullets, ...) from a
+    field showname. The same shownames repeat across messages of a type_id, so
+    results are memoized; a showname without letters is returned unchanged.
+    """
+    for idx, char in enumerate(showname):
+        if char.isalpha():
+            return showname[idx:]
+    return showname
+
+
+def normalize_record(record, order):
+    """
+    Prepares a decoded message for MongoDB: assigns its order, converts the
+    timestamp string into a datetime and stringifies ciphering keys that do
+    not fit into BSON integers.
+    """
+    record["order"] = order
+    if isinstance(record["timestamp"], str):
+        record["timestamp"] = datetime.fromisoformat(record["timestamp"])
+    if "Subpackets" in record and isinstance(record["Subpackets"], list):
+        for sub in record["Subpackets"]:
+            if "SRB Ciphering Keys" in sub:
+                sub["SRB Ciphering Keys"] = str(sub["SRB Ciphering Keys"])
+                sub["DRB Ciphering Keys"] = str(sub["DRB Ciphering Keys"])
+    return record
+
+
+def to_json_value(value):
+    """
+    Converts a decoded packet value into what a decode_json/json.loads round
+    trip would produce, without serializing it.
+    """
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, dict):
+        return {
+            k if isinstance(k, str) else str(k): to_json_value(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(v) for v in value]
+    return str(value)
+
+
+def decode_msg_xml(xml_text):
+    """
+    Collects the normalized showname -> value pairs of every <field> of a Msg
+    in a single expat pass, without building an element tree.
+    """
+    msg_dict = {}
+
+    def start_element(tag, attrs):
+        if tag == "field":
+            showname = attrs.get("showname")
+            value = attrs.get("value")
+            if showname is not None and value is not None:
+                msg_dict[normalize_showname(showname)] = value
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.Parse(xml_text, True)
+    return msg_dict
+
+
+def decode_message(data):
+    """
+    Builds the MongoDB document of a message from its decoded packet dict.
+    The timestamp stays a datetime; everything else matches the legacy path.
+    """
+    msg_fields = {}
+    for k, v in data.items():
+        if k == "timestamp":
+            msg_fields[k] = v
+        elif k != "Msg":
+            msg_fields[k] = to_json_value(v)
+
+    if "Msg" in data:
+        msg_fields["Msg"] = decode_msg_xml(data["Msg"])
+    return msg_fields
+
 
 class myAnalyzer(Analyzer):
-    def __init__(self):
+    def __init__(self, sink=None, legacy_decode=LEGACY_DECODE, first_order=0):
         Analyzer.__init__(self)
-        self.add_source_callback(self.__msg_callback)
+        # Stage timing has its own callback so it costs nothing when disabled
+        if metrics.enabled:
+            self.add_source_callback(self.__timed_msg_callback)
+        else:
+            self.add_source_callback(self.__msg_callback)
         self.unsupported = []
         self.field_list = []
+        # When a sink is given, normalized records are streamed to it as they
+        # are decoded instead of being buffered in field_list.
+        self.sink = sink
+        self.record_count = 0
+        # Orders continue from first_order when decoding the tail of a log
+        # that was appended to.
+        self.first_order = first_order
+        # The legacy path round-trips every message through decode_json,
+        # json.loads and ET.XML; it is kept for output-equivalence checks.
+        self.legacy_decode = legacy_decode
+        # Seconds spent per decoding stage, reported once the replay finishes
+        self.stage_seconds = {"decode": 0.0, "msg_xml": 0.0, "sink": 0.0}
 
     def set_source(self, source):
         Analyzer.set_source(self, source)
         source.enable_log_all()
 
     def __msg_callback(self, msg):
+        if self.legacy_decode:
+            self.__legacy_msg_callback(msg)
+        else:
+            self.__emit(decode_message(msg.data.decode()))
+
+    def __timed_msg_callback(self, msg):
+        if self.legacy_decode:
+            start = time.perf_counter()
+            self.__legacy_msg_callback(msg)
+            self.stage_seconds["decode"] += time.perf_counter() - start
+            return
+        start = time.perf_counter()
+        data = msg.data.decode()
+        decoded = time.perf_counter()
+        msg_fields = decode_message(data)
+        parsed = time.perf_counter()
+        self.__emit(msg_fields)
+        self.stage_seconds["decode"] += decoded - start
+        self.stage_seconds["msg_xml"] += parsed - decoded
+        self.stage_seconds["sink"] += time.perf_counter() - parsed
+
+    def report_metrics(self, seconds: float) -> None:
+        """
+        Records the stage timings of a replay that took ``seconds``; the time
+        not spent in the callback is the replayer's own.
+        """
+        for stage, stage_seconds in self.stage_seconds.items():
+            metrics.observe(f"analyzer.{stage}", stage_seconds, self.record_count)
+        metrics.observe(
+            "analyzer.replay", seconds - sum(self.stage_seconds.values())
+        )
+        metrics.count("analyzer.messages", self.record_count)
+
+    def __legacy_msg_callback(self, msg):
         msg_fields = {}
         data = msg.data.decode_json()
         data = json.loads(data)
@@ -38,7 +180,7 @@ class myAnalyzer(Analyzer):
         if "Msg" in data.keys():
             log_xml = ET.XML(data["Msg"])
         else:
-            self.field_list.append(msg_fields)
+            self.__emit(msg_fields)
             return
 
         xml_msg = Event(msg.timestamp, msg.type_id, log_xml)
@@ -46,36 +188,85 @@ class myAnalyzer(Analyzer):
         msg_dict = {}
         for field in xml_msg.data.iter("field"):
             if field.get("showname") != None and field.get("value") != None:
-                showname = field.get("showname")
-                mask = np.array([char.isalpha() for char in list(showname)])
-                start_idx = np.where(mask)[0][0]
-                msg_dict[showname[start_idx:]] = field.get("value")
+                msg_dict[normalize_showname(field.get("showname"))] = field.get(
+                    "value"
+                )
 
         msg_fields["Msg"] = msg_dict
-        self.field_list.append(msg_fields)
+        self.__emit(msg_fields)
 
+    def __emit(self, msg_fields):
+        if self.sink is None:
+            self.field_list.append(msg_fields)
+        else:
+            self.sink(
+                normalize_record(msg_fields, self.first_order + self.record_count)
+            )
+        self.record_count += 1
 
-client = MongoClient("localhost", 27017)
-db = client["mobile_insight"]
 
+client = get_client()
+db = get_database()
 
-def my_analysis(input_object):
+
+def my_analysis(input_object, sink=None, legacy_decode=LEGACY_DECODE, first_order=0):
     src = OfflineReplayer()
     src.set_input_file(input_object)
     src.enable_log_all()
 
-    analyzer = myAnalyzer()
+    analyzer = myAnalyzer(sink, legacy_decode, first_order)
     analyzer.set_source(src)
-    src.run()
+    if not metrics.enabled:
+        src.run()
+        return analyzer
 
+    hits, misses = normalize_showname.cache_info()[:2]
+    start = time.perf_counter()
+    src.run()
+    analyzer.report_metrics(time.perf_counter() - start)
+    cache_info = normalize_showname.cache_info()
+    metrics.count("analyzer.showname_cache_hits", cache_info.hits - hits)
+    metrics.count("analyzer.showname_cache_misses", cache_info.misses - misses)
     return analyzer
 
 
+def frame_ranges(file_doc, args):
+    """
+    Yields the frame byte ranges recorded at ingest of the records matching
+    the export filters, in file order.
+    """
+    query = {"timestamp": {"$gte": args["start_date"], "$lt": args["end_date"]}}
+    if args["type_id"]:
+        query["type_id"] = {"$in": args["type_id"]}
+    collection, base = record_source(db, file_doc)
+    for doc in collection.find(
+        {**base, **query}, {"offset": 1, "length": 1, "_id": 0}
+    ).sort("order", 1):
+        yield doc["offset"], doc["length"]
+
+
+def download_indexed_bytes(file_doc, args):
+    """
+    Builds a filtered mi2log file from the frame byte ranges recorded at
+    ingest, reading only the matching frames from GridFS.
+    """
+    ranges = frame_ranges(file_doc, args)
+    # The range query streams into the GridFS reads, so both are timed at once
+    with metrics.timer("download_bytes.indexed"):
+        with open_blob(GridFS(db), file_doc["data_id"]) as blob:
+            return read_frames(blob, ranges)
+
+
 def download_bytes(args):
+    file_doc = db["mi2log"].find_one({"filename": args["filename"]})
+    if file_doc.get("frame_index"):
+        return download_indexed_bytes(file_doc, args)
+
     src = OfflineReplayer()
-    file_id = db["mi2log"].find_one({"filename": args["filename"]})["data_id"]
+    file_id = file_doc["data_id"]
     # Retrieve the file data from GridFS
-    file_data = GridFS(db).get(file_id).read()
+    with metrics.timer("download_bytes.gridfs_read"):
+        file_data = read_blob(GridFS(db), file_id)
     src.set_input_file(file_data)
 
     if args["type_id"]:
@@ -84,5 +275,6 @@ def download_bytes(args):
     else:
         src.enable_log_all(args["start_date"], args["end_date"])
 
-    src.run()
+    with metrics.timer("download_bytes.replay"):
+        src.run()
     return bytes(src.output_bytes_object)
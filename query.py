@@ -0,0 +1,239 @@
+"""
+Cross-file queries over decoded Msg fields.
+
+A query is a list of ``(field, operator, value)`` predicates on the normalized
+shownames of the ``Msg`` dict, optionally restricted by type_id and time, and
+runs over any number of stored files. Matches are streamed file by file in
+``order``; ``query_page`` pages through them with a keyset token and
+``explain_query`` reports how much of the work an index served.
+
+Fields are indexed at ingest when listed in ``MSG_INDEX_FIELDS`` or when they
+are among the most queried ones.
+"""
+
+# Standard Library Imports
+import re
+from datetime import datetime
+from itertools import islice
+
+# Local Imports
+from storage import open_records
+from msg_schema import open_codec
+from config import (
+    EXPORT_BATCH_SIZE,
+    MSG_INDEX_AUTO_FIELDS,
+    MSG_INDEX_FIELDS,
+    MSG_INDEX_MIN_QUERIES,
+)
+
+FIELD_STATS_COLLECTION = "msg_field_stats"
+
+# Msg values are stored as strings, so predicates compare strings
+OPERATORS = {
+    "=": lambda value: value,
+    "!=": lambda value: {"$ne": value},
+    "in": lambda value: {"$in": [item.strip() for item in value.split(",")]},
+    "contains": lambda value: {"$regex": re.escape(value)},
+    "exists": lambda value: {"$exists": True},
+}
+
+
+def build_msg_query(
+    predicates: list, type_ids: list = None, start_date=None, end_date=None
+) -> dict:
+    """
+    Translates Msg field predicates and the usual filters into a record query.
+
+    Args:
+        predicates (list): ``(field, operator, value)`` tuples, see ``OPERATORS``.
+        type_ids (list): The type_ids to match, or None for all.
+        start_date: The inclusive start of the time range, if any.
+        end_date: The exclusive end of the time range, if any.
+
+    Returns:
+        dict: The MongoDB record filter.
+    """
+    conditions = [
+        {f"Msg.{field}": OPERATORS[operator](value)}
+        for field, operator, value in predicates
+    ]
+    query = {"$and": conditions} if len(conditions) > 1 else dict(*conditions)
+    if type_ids:
+        query["type_id"] = {"$in": list(type_ids)}
+    if start_date is not None or end_date is not None:
+        query["timestamp"] = {}
+        if start_date is not None:
+            query["timestamp"]["$gte"] = start_date
+        if end_date is not None:
+            query["timestamp"]["$lt"] = end_date
+    return query
+
+
+def query_projection(fields: list) -> dict:
+    """
+    Returns the projection of query matches: the record keys and the queried
+    Msg fields.
+    """
+    projection = {"_id": 0, "type_id": 1, "timestamp": 1, "order": 1}
+    projection.update({f"Msg.{field}": 1 for field in fields})
+    return projection
+
+
+def iter_matches(db, filenames: list, query: dict, projection: dict, after=(0, -1)):
+    """
+    Streams the records matching a query across files, file by file in
+    ``order``, starting after a keyset position.
+
+    Args:
+        db: The MongoDB database.
+        filenames (list): The files to search, in result order.
+        query (dict): The record filter.
+        projection (dict): The fields to return.
+        after (tuple): ``(file_index, order)`` of the last record already seen.
+
+    Yields:
+        tuple: ``(file_index, record)`` with the filename added to the record.
+    """
+    file_index, after_order = after
+    codec = None
+    for idx in range(file_index, len(filenames)):
+        collection, base = open_records(db, filenames[idx])
+        # Files with compact Msg fields are queried by key and decoded
+        file_query, file_projection = query, projection
+        file_codec = open_codec(db, filenames[idx], codec)
+        if file_codec:
+            codec = file_codec
+            file_query = codec.translate(query)
+            file_projection = codec.translate(projection)
+        cursor = (
+            collection.find(
+                {**base, **file_query, "order": {"$gt": after_order}},
+                file_projection,
+            )
+            .sort("order", 1)
+            .batch_size(EXPORT_BATCH_SIZE)
+        )
+        for record in cursor:
+            if file_codec:
+                file_codec.decode_record(record)
+            record["filename"] = filenames[idx]
+            yield idx, record
+        after_order = -1
+
+
+def query_page(
+    db, filenames: list, query: dict, projection: dict, after=(0, -1), limit=100
+) -> tuple:
+    """
+    Reads one page of matches.
+
+    Returns:
+        tuple: The matching records and the keyset token of the next page, or
+        None on the last page.
+    """
+    matches = list(
+        islice(iter_matches(db, filenames, query, projection, after), limit + 1)
+    )
+    records = [record for _, record in matches[:limit]]
+    if len(matches) <= limit:
+        return records, None
+    file_index, last = matches[limit - 1]
+    return records, (file_index, last["order"])
+
+
+def _plan_nodes(node):
+    """
+    Walks every dict of an explain output.
+    """
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _plan_nodes(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _plan_nodes(value)
+
+
+def explain_query(db, filenames: list, query: dict) -> tuple:
+    """
+    Explains a query on every file and reports how much of it an index served.
+
+    Returns:
+        tuple: One dict per file with the indexes of the winning plan and the
+        keys and documents examined, and a summary with the totals, the share
+        of files answered through an index and the share of examined documents
+        that matched.
+    """
+    plans = []
+    codec = None
+    for filename in filenames:
+        collection, base = open_records(db, filename)
+        file_query = query
+        file_codec = open_codec(db, filename, codec)
+        if file_codec:
+            codec = file_codec
+            file_query = codec.translate(query)
+        explain = (
+            collection.find({**base, **file_query}).sort("order", 1).explain()
+        )
+        nodes = list(_plan_nodes(explain))
+        # Rejected plans also list index scans, so only the winning plan counts
+        winning = [node["winningPlan"] for node in nodes if "winningPlan" in node]
+        indexes = sorted(
+            {
+                node["indexName"]
+                for node in _plan_nodes(winning)
+                if node.get("stage") == "IXSCAN"
+            }
+        )
+        stats = next((node for node in nodes if "totalDocsExamined" in node), {})
+        plans.append(
+            {
+                "filename": filename,
+                "indexes": ", ".join(indexes) or "COLLSCAN",
+                "keys examined": stats.get("totalKeysExamined", 0),
+                "docs examined": stats.get("totalDocsExamined", 0),
+                "returned": stats.get("nReturned", 0),
+            }
+        )
+
+    docs_examined = sum(plan["docs examined"] for plan in plans)
+    returned = sum(plan["returned"] for plan in plans)
+    summary = {
+        "files": len(plans),
+        "indexed files": sum(plan["indexes"] != "COLLSCAN" for plan in plans),
+        "keys examined": sum(plan["keys examined"] for plan in plans),
+        "docs examined": docs_examined,
+        "returned": returned,
+        "selectivity": returned / docs_examined if docs_examined else 1.0,
+    }
+    return plans, summary
+
+
+def record_field_usage(db, fields) -> None:
+    """
+    Counts the queries on each Msg field, used to choose indexes at ingest.
+    """
+    now = datetime.now()
+    for field in set(fields):
+        db[FIELD_STATS_COLLECTION].update_one(
+            {"_id": field},
+            {"$inc": {"count": 1}, "$set": {"last_used": now}},
+            upsert=True,
+        )
+
+
+def msg_index_fields(db) -> list:
+    """
+    Returns the Msg fields to index in a newly ingested log: the configured
+    ones and the most queried ones.
+    """
+    fields = list(MSG_INDEX_FIELDS)
+    popular = (
+        db[FIELD_STATS_COLLECTION]
+        .find({"count": {"$gte": MSG_INDEX_MIN_QUERIES}}, {"_id": 1})
+        .sort("count", -1)
+        .limit(MSG_INDEX_AUTO_FIELDS)
+    )
+    fields.extend(doc["_id"] for doc in popular if doc["_id"] not in fields)
+    return fields
@@ -0,0 +1,284 @@
+"""
+Record storage layouts.
+
+Records of a log file live either in a collection named after the file (the
+original layout) or in the shared ``records`` time-series collection, where
+they carry the ``file_id`` of their mi2log document. Readers go through
+``record_source`` so both layouts can coexist; existing files are moved
+between them with
+
+    python storage.py --to timeseries
+"""
+
+# Standard Library Imports
+import argparse
+import uuid
+
+# Third-Party Library Imports
+from bson import ObjectId
+from pymongo.errors import CollectionInvalid
+
+# Local Imports
+from msg_schema import MsgCodec
+from config import (
+    INGEST_BATCH_SIZE,
+    MSG_ENCODING,
+    STORAGE_MODE,
+    TIMESERIES_GRANULARITY,
+)
+
+RECORDS_COLLECTION = "records"
+
+
+def create_record_indexes(collection, msg_paths=()) -> None:
+    """
+    Creates the indexes used by the Display tab and the exports on a per-file
+    collection, and one index per queried Msg field path.
+    """
+    collection.create_index([("type_id", 1), ("timestamp", 1), ("order", 1)])
+    collection.create_index([("timestamp", 1), ("order", 1)])
+    collection.create_index([("order", 1)])
+    for path in msg_paths:
+        collection.create_index([(path, 1), ("order", 1)])
+
+
+def ensure_records_collection(db, msg_paths=()):
+    """
+    Creates the shared time-series collection and its indexes if needed,
+    including one index per queried Msg field path.
+
+    Returns:
+        Collection: The time-series collection.
+    """
+    if RECORDS_COLLECTION not in db.list_collection_names(
+        filter={"name": RECORDS_COLLECTION}
+    ):
+        try:
+            db.create_collection(
+                RECORDS_COLLECTION,
+                timeseries={
+                    "timeField": "timestamp",
+                    "metaField": "file_id",
+                    "granularity": TIMESERIES_GRANULARITY,
+                },
+            )
+        except CollectionInvalid:
+            # Created concurrently by another worker
+            pass
+    records = db[RECORDS_COLLECTION]
+    records.create_index([("file_id", 1), ("type_id", 1), ("timestamp", 1)])
+    records.create_index([("file_id", 1), ("timestamp", 1)])
+    records.create_index([("file_id", 1), ("order", 1)])
+    for path in msg_paths:
+        records.create_index([("file_id", 1), (path, 1), ("order", 1)])
+    return records
+
+
+def record_source(db, file_doc: dict) -> tuple:
+    """
+    Locates the records of a log file.
+
+    Args:
+        db: The MongoDB database.
+        file_doc (dict): The mi2log document of the file.
+
+    Returns:
+        tuple: The collection holding the records and the filter selecting
+        them, to be combined with any record query.
+    """
+    if file_doc.get("file_id") is not None:
+        return db[RECORDS_COLLECTION], {"file_id": file_doc["file_id"]}
+    return db[file_doc["filename"]], {}
+
+
+def open_records(db, filename: str) -> tuple:
+    """
+    Locates the records of a log file by name, see ``record_source``.
+    """
+    file_doc = db["mi2log"].find_one({"filename": filename}, {"file_id": 1})
+    return record_source(db, {"filename": filename, **(file_doc or {})})
+
+
+def file_encoding(file_doc: dict) -> str:
+    """
+    Returns the Msg encoding of a stored log, see ``msg_schema``.
+    """
+    return file_doc.get("msg_encoding", "plain")
+
+
+class RecordStaging:
+    """
+    Holds a new generation of a file's records until it is complete.
+
+    In the per-file layout the records go to a staging collection that is
+    renamed over the file's collection on ``commit``. In the time-series layout
+    they are written under a fresh ``file_id``, which becomes visible once the
+    mi2log document points at it. With the compact ``encoding`` the Msg fields
+    are stored under their registry keys.
+
+    A staging collection starts with the ``order`` index only, which retried
+    inserts look records up by; the other indexes are built once on
+    ``commit`` instead of being maintained by every insert of the load.
+    """
+
+    def __init__(
+        self,
+        db,
+        log_name: str,
+        mode: str = STORAGE_MODE,
+        msg_fields=(),
+        encoding: str = MSG_ENCODING,
+    ):
+        self.db = db
+        self.log_name = log_name
+        self.mode = mode
+        self.encoding = encoding
+        self.codec = MsgCodec(db) if encoding == "compact" else None
+        self.msg_paths = [
+            f"Msg.{self.codec.register(field)}" if self.codec else f"Msg.{field}"
+            for field in msg_fields
+        ]
+        if mode == "timeseries":
+            self.collection = ensure_records_collection(db, self.msg_paths)
+            self.fields = {"file_id": ObjectId()}
+        else:
+            self.collection = db[f"_ingest.{uuid.uuid4().hex}.{log_name}"]
+            self.collection.create_index([("order", 1)])
+            self.fields = {}
+
+    def prepare(self, record: dict) -> dict:
+        """
+        Encodes the Msg fields of a decoded record and adds the staging fields
+        before it is inserted.
+        """
+        if self.codec:
+            self.codec.encode_record(record)
+        record.update(self.fields)
+        return record
+
+    def commit(self) -> dict:
+        """
+        Makes the staged records the file's collection.
+
+        Returns:
+            dict: The fields to store on the file's mi2log document.
+        """
+        if self.mode == "timeseries":
+            return {
+                "file_id": self.fields["file_id"],
+                "msg_encoding": self.encoding,
+            }
+        create_record_indexes(self.collection, self.msg_paths)
+        self.collection.rename(self.log_name, dropTarget=True)
+        return {"file_id": None, "msg_encoding": self.encoding}
+
+    def discard(self) -> None:
+        """
+        Removes the staged records.
+        """
+        if self.mode == "timeseries":
+            self.collection.delete_many(self.fields)
+        else:
+            self.collection.drop()
+
+
+def release_records(db, file_doc: dict, replacement: dict = None) -> None:
+    """
+    Removes the records of a file that was deleted or replaced.
+
+    Time-series generations are shared by files with identical content, so they
+    are only deleted once no mi2log document references them. A per-file
+    collection is dropped unless the replacement took it over.
+
+    Args:
+        db: The MongoDB database.
+        file_doc (dict): The previous mi2log document of the file.
+        replacement (dict): The mi2log document that replaced it, if any.
+    """
+    file_id = file_doc.get("file_id")
+    if file_id is not None:
+        if replacement and replacement.get("file_id") == file_id:
+            return
+        if not db["mi2log"].find_one({"file_id": file_id}, {"_id": 1}):
+            db[RECORDS_COLLECTION].delete_many({"file_id": file_id})
+    elif replacement is None or replacement.get("file_id") is not None:
+        db.drop_collection(file_doc["filename"])
+
+
+def rename_records(db, file_doc: dict, new_filename: str) -> None:
+    """
+    Moves the records of a file renamed to ``new_filename``. Time-series
+    records are keyed by file id and do not move.
+    """
+    if file_doc.get("file_id") is None:
+        db[file_doc["filename"]].rename(new_filename)
+
+
+def migrate_file(db, file_doc: dict, mode: str) -> bool:
+    """
+    Moves the records of a stored log into the given layout.
+
+    Returns:
+        bool: Whether the records were moved.
+    """
+    collection, base = record_source(db, file_doc)
+    in_timeseries = file_doc.get("file_id") is not None
+    if in_timeseries == (mode == "timeseries"):
+        return False
+
+    staging = RecordStaging(
+        db, file_doc["filename"], mode, encoding=file_encoding(file_doc)
+    )
+    try:
+        if mode == "timeseries":
+            cursor = collection.find(base, {"_id": 0}).sort("order", 1)
+            batch = []
+            for record in cursor:
+                # Records keep the encoding they were stored with
+                record.update(staging.fields)
+                batch.append(record)
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    staging.collection.insert_many(batch)
+                    batch = []
+            if batch:
+                staging.collection.insert_many(batch)
+        else:
+            collection.aggregate(
+                [
+                    {"$match": base},
+                    {"$project": {"_id": 0, "file_id": 0}},
+                    {"$out": staging.collection.name},
+                ]
+            )
+        fields = staging.commit()
+    except Exception:
+        staging.discard()
+        raise
+
+    replacement = {**file_doc, **fields}
+    db["mi2log"].update_one({"_id": file_doc["_id"]}, {"$set": fields})
+    release_records(db, file_doc, replacement)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Move stored log records between storage layouts."
+    )
+    parser.add_argument(
+        "--to", choices=["collection", "timeseries"], default="timeseries"
+    )
+    parser.add_argument("filenames", nargs="*", help="Files to migrate (default: all)")
+    args = parser.parse_args()
+
+    # my_analyzer reads records through this module, so import it lazily
+    from my_analyzer import db
+
+    query = {"filename": {"$in": args.filenames}} if args.filenames else {}
+    for file_doc in db["mi2log"].find(query):
+        moved = migrate_file(db, file_doc, args.to)
+        print(f"{file_doc['filename']}: {'migrated' if moved else 'skipped'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# Standard Library Imports
+from collections import Counter
+from datetime import datetime, timedelta
+
+# Third-Party Library Imports
+import pandas as pd
+
+# Local Imports
+from storage import record_source
+from config import SUMMARY_BUCKET_SECONDS, SUMMARY_MAX_BUCKETS
+
+# Histogram buckets are aligned like MongoDB's $dateTrunc, whose bins start at
+# this reference date, so summary and aggregated histograms agree.
+BUCKET_REFERENCE = datetime(2000, 1, 1)
+ONE_SECOND = timedelta(seconds=1)
+
+
+class SummaryBuilder:
+    """
+    Accumulates the summary of a file while its records are decoded: the
+    record count, time range, per-type_id counts and record histograms at the
+    ``SUMMARY_BUCKET_SECONDS`` bucket sizes.
+
+    Histograms with more than ``SUMMARY_MAX_BUCKETS`` buckets are dropped and
+    listed as ``dropped`` in the summary. A resumed summary never rebuilds
+    them, since it would only count the records added after resuming.
+    """
+
+    def __init__(self, bucket_seconds: list = SUMMARY_BUCKET_SECONDS):
+        self.records = 0
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.type_counts = Counter()
+        self.buckets = {size: Counter() for size in bucket_seconds}
+        self.dropped = set()
+
+    @classmethod
+    def from_summary(cls, summary: dict):
+        """
+        Resumes a stored summary, e.g. to add the records of an appended tail.
+        """
+        builder = cls()
+        builder.records = summary["records"]
+        builder.min_timestamp = summary["min_timestamp"]
+        builder.max_timestamp = summary["max_timestamp"]
+        builder.type_counts.update(summary["type_counts"])
+        for size, counter in list(builder.buckets.items()):
+            histogram = summary["histograms"].get(str(size))
+            if histogram is None:
+                # Dropped, or stored before this bucket size was configured:
+                # either way the stored records are not in it
+                if summary["records"]:
+                    builder.drop(size)
+                continue
+            first = (histogram["start"] - BUCKET_REFERENCE) // ONE_SECOND // size
+            counter.update(
+                {first + idx: count for idx, count in enumerate(histogram["counts"])}
+            )
+        return builder
+
+    def drop(self, size: int) -> None:
+        """
+        Stops building the histogram of a bucket size.
+        """
+        self.buckets.pop(size, None)
+        self.dropped.add(size)
+
+    def add(self, record: dict) -> None:
+        """
+        Adds a normalized record to the summary.
+        """
+        timestamp = record["timestamp"]
+        self.records += 1
+        if self.min_timestamp is None or timestamp < self.min_timestamp:
+            self.min_timestamp = timestamp
+        if self.max_timestamp is None or timestamp > self.max_timestamp:
+            self.max_timestamp = timestamp
+        self.type_counts[record["type_id"]] += 1
+        seconds = (timestamp - BUCKET_REFERENCE) // ONE_SECOND
+        for size, counter in self.buckets.items():
+            counter[seconds // size] += 1
+
+    def build(self) -> dict:
+        """
+        Returns the summary document stored on the file's mi2log document.
+        Histograms are stored densely from their first bucket on.
+        """
+        histograms = {}
+        for size, counter in list(self.buckets.items()):
+            if not counter:
+                continue
+            first, last = min(counter), max(counter)
+            if last - first + 1 > SUMMARY_MAX_BUCKETS:
+                self.drop(size)
+                continue
+            histograms[str(size)] = {
+                "start": BUCKET_REFERENCE + timedelta(seconds=first * size),
+                "counts": [counter.get(idx, 0) for idx in range(first, last + 1)],
+            }
+        duration = (
+            (self.max_timestamp - self.min_timestamp).total_seconds()
+            if self.records
+            else 0.0
+        )
+        return {
+            "records": self.records,
+            "min_timestamp": self.min_timestamp,
+            "max_timestamp": self.max_timestamp,
+            "type_counts": dict(self.type_counts),
+            "rate": self.records / duration if duration else None,
+            "histograms": histograms,
+            "dropped": sorted(self.dropped),
+        }
+
+
+def summarize_records(db, file_doc: dict) -> dict:
+    """
+    Builds the summary of a file stored before summaries were written at
+    ingest from its records, and stores it.
+    """
+    collection, base = record_source(db, file_doc)
+    builder = SummaryBuilder()
+    for record in collection.find(base, {"type_id": 1, "timestamp": 1, "_id": 0}):
+        builder.add(record)
+    summary = builder.build()
+    db["mi2log"].update_one({"_id": file_doc["_id"]}, {"$set": {"summary": summary}})
+    return summary
+
+
+def covers_file(summary: dict, start_date, end_date) -> bool:
+    """
+    Returns whether a time range includes every record of the file.
+    """
+    return (
+        start_date <= summary["min_timestamp"] and end_date > summary["max_timestamp"]
+    )
+
+
+def summary_count(summary: dict, type_ids: list, start_date, end_date):
+    """
+    Counts the records of the given type_ids from the summary.
+
+    Returns:
+        int: The count, or None if the time range does not cover the file.
+    """
+    if not covers_file(summary, start_date, end_date):
+        return None
+    if not type_ids:
+        return summary["records"]
+    return sum(summary["type_counts"].get(type_id, 0) for type_id in type_ids)
+
+
+def summary_histogram(summary: dict, start_date, end_date, timestamp_scale: int):
+    """
+    Reads the record histogram of a whole file from the summary.
+
+    Returns:
+        pd.DataFrame: The non-empty bucket starts and their counts, or None if
+        the histogram is not stored at that scale or the time range does not
+        cover the file.
+    """
+    histogram = summary["histograms"].get(str(timestamp_scale))
+    if histogram is None or not covers_file(summary, start_date, end_date):
+        return None
+    count_df = pd.DataFrame(
+        {
+            "timestamp": pd.date_range(
+                histogram["start"],
+                periods=len(histogram["counts"]),
+                freq=pd.Timedelta(seconds=timestamp_scale),
+            ),
+            "count": histogram["counts"],
+        }
+    )
+    return count_df[count_df["count"] > 0].reset_index(drop=True)
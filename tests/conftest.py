@@ -0,0 +1,6 @@
+# Standard Library Imports
+import os
+import sys
+
+# The app modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
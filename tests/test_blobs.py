@@ -0,0 +1,44 @@
+# Standard Library Imports
+import hashlib
+
+# Third-Party Library Imports
+import mongomock
+import mongomock.gridfs
+import pytest
+from gridfs import GridFS
+
+# Local Imports
+from blobs import extend_blob, put_blob, read_blob
+
+BASE = bytes(range(256)) * 3000
+TAIL = b"appended tail " * 40000
+
+mongomock.gridfs.enable_gridfs_integration()
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_extend_blob_retry_after_interrupted_attempt(compression):
+    db = mongomock.MongoClient()["test"]
+    fs = GridFS(db)
+    stored = put_blob(fs, BASE, "log.mi2log", compression=compression)
+    data_id = stored["data_id"]
+    sha256 = hashlib.sha256(BASE + TAIL).hexdigest()
+
+    # The chunks are written but the attempt stops before the files document
+    before = db["fs.files"].find_one({"_id": data_id})
+    extend_blob(db, data_id, TAIL, sha256, len(BASE))
+    db["fs.files"].replace_one({"_id": data_id}, before)
+
+    extend_blob(db, data_id, TAIL, sha256, len(BASE))
+    assert read_blob(fs, data_id) == BASE + TAIL
+
+    # Applying the same append again leaves the log as it is
+    extend_blob(db, data_id, TAIL, sha256, len(BASE))
+    assert read_blob(fs, data_id) == BASE + TAIL
+
+
+def test_extend_blob_refuses_a_log_of_another_length():
+    db = mongomock.MongoClient()["test"]
+    data_id = put_blob(GridFS(db), BASE, "log.mi2log", compression="none")["data_id"]
+    with pytest.raises(RuntimeError):
+        extend_blob(db, data_id, TAIL, "0" * 64, len(BASE) - 1)
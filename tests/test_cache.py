@@ -0,0 +1,39 @@
+# Third-Party Library Imports
+import fakeredis
+
+# Local Imports
+from cache import ResultCache
+
+
+def counting(result):
+    calls = []
+
+    def compute():
+        calls.append(result)
+        return result
+
+    return compute, calls
+
+
+def test_results_of_other_content_are_not_served():
+    cache = ResultCache(fakeredis.FakeRedis())
+    compute, calls = counting("old")
+    assert cache.get_or_compute("json", "a.mi2log", "sha-old:0", {}, compute) == "old"
+    assert cache.get_or_compute("json", "a.mi2log", "sha-old:0", {}, compute) == "old"
+    assert len(calls) == 1
+
+    # The counter was never bumped, e.g. Redis was down during the upload
+    compute, calls = counting("new")
+    assert cache.get_or_compute("json", "a.mi2log", "sha-new:0", {}, compute) == "new"
+    assert calls == ["new"]
+
+
+def test_invalidate_during_the_retry_window_bumps_the_version():
+    cache = ResultCache(fakeredis.FakeRedis())
+    cache._failed()
+    assert cache.version("a.mi2log") == 0
+
+    cache.invalidate("a.mi2log")
+
+    assert cache._available()
+    assert cache.version("a.mi2log") == 1
@@ -0,0 +1,70 @@
+# Standard Library Imports
+import os
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+# Third-Party Library Imports
+import pytest
+
+# Local Imports
+import export_service
+from export_service import ExportService, make_server, publish_spool
+
+SPOOL_NAME = "0" * 40 + ".ndjson"
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(export_service, "EXPORT_SPOOL_DIR", str(tmp_path))
+    (tmp_path / SPOOL_NAME).write_bytes(b"0123456789")
+    server = make_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield tmp_path, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def fetch(url: str, **headers):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as r:
+            return r.status, r.read()
+    except urllib.error.HTTPError as e:
+        return e.code, b""
+
+
+def test_spool_files_are_served_by_token_only(server):
+    spool_dir, url = server
+    token = publish_spool(os.path.join(spool_dir, SPOOL_NAME))
+
+    assert fetch(f"{url}/{token}") == (200, b"0123456789")
+    assert fetch(f"{url}/{token}", Range="bytes=4-") == (206, b"456789")
+    assert fetch(f"{url}/{SPOOL_NAME}")[0] == 404
+    assert fetch(f"{url}/{'A' * 43}")[0] == 404
+
+
+def test_token_of_an_expired_export_is_not_served(server):
+    spool_dir, url = server
+    token = publish_spool(os.path.join(spool_dir, SPOOL_NAME))
+    os.remove(spool_dir / SPOOL_NAME)
+
+    assert fetch(f"{url}/{token}")[0] == 404
+
+
+def test_prune_forgets_failed_and_expired_jobs(server):
+    spool_dir, _ = server
+    service = ExportService(db=None, workers=1)
+    finished_at = datetime.now() - timedelta(hours=1)
+    live_token = publish_spool(os.path.join(spool_dir, SPOOL_NAME))
+    jobs = {
+        "failed": {"status": "failed", "token": None},
+        "expired": {"status": "done", "token": "A" * 43},
+        "done": {"status": "done", "token": live_token},
+        "running": {"status": "running", "token": None},
+    }
+    for job_id, job in jobs.items():
+        service._jobs[job_id] = {"id": job_id, "finished_at": finished_at, **job}
+
+    service.prune(max_age=60)
+
+    assert sorted(service._jobs) == ["done", "running"]
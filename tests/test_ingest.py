@@ -0,0 +1,74 @@
+# Standard Library Imports
+import time
+
+# Third-Party Library Imports
+import mongomock
+import pytest
+
+# Local Imports
+from ingest import BatchWriter, ingest_files
+
+
+def test_batch_writer_reports_records_bson_cannot_encode():
+    collection = mongomock.MongoClient().db.records
+    writer = BatchWriter(collection, batch_size=10, threads=2, max_pending=1)
+    for order in range(100):
+        record = {"order": order, "Msg": {"value": str(order)}}
+        if order == 42:
+            # Wider than the 8-byte integers BSON stores
+            record["Msg"]["value"] = 2**70
+        writer.put(record)
+    writer.close()
+
+    assert len(writer.errors) == 1
+    assert isinstance(writer.errors[0], OverflowError)
+    assert writer.inserted == 90
+    assert collection.count_documents({}) >= 90
+    with pytest.raises(RuntimeError):
+        writer.raise_errors()
+
+
+def test_batch_writer_sizing_batches_reports_records_bson_cannot_encode():
+    collection = mongomock.MongoClient().db.records
+    writer = BatchWriter(collection, batch_size=10, batch_bytes=1000)
+    for order in range(100):
+        writer.put({"order": order, "Msg": {"value": 2**70 if order == 42 else 1}})
+    writer.close()
+
+    assert len(writer.errors) == 1
+    assert isinstance(writer.errors[0], OverflowError)
+    assert writer.inserted == 99
+
+
+class SlowCollection:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def insert_many(self, records, ordered=True):
+        time.sleep(self.seconds)
+
+
+def test_batch_writer_rate_leaves_out_time_waiting_for_the_analyzer():
+    writer = BatchWriter(SlowCollection(0.02), batch_size=10, write_concern="")
+    for order in range(50):
+        writer.put({"order": order})
+        # A slow analyzer: the writer waits most of the time
+        time.sleep(0.004)
+    writer.close()
+
+    assert writer.inserted == 50
+    assert 0.1 <= writer.busy_seconds < writer.seconds
+    assert writer.docs_per_second > 50 / writer.seconds
+
+
+def test_ingest_files_reports_every_file_of_a_shared_name():
+    results = list(
+        ingest_files([("x.mi2log", "a/x.mi2log"), ("x.mi2log", "b/x.mi2log")])
+    )
+
+    assert len(results) == 2
+    assert all(result is None for _, result, _ in results)
+    assert [str(error).split()[0] for _, _, error in results] == [
+        "a/x.mi2log",
+        "b/x.mi2log",
+    ]
@@ -0,0 +1,48 @@
+# Standard Library Imports
+from datetime import datetime, timedelta
+
+# Local Imports
+import summary
+from summary import SummaryBuilder
+
+START = datetime(2024, 1, 1)
+
+
+def records(count: int, start: datetime, step: timedelta):
+    return [
+        {"type_id": "LTE_RRC_OTA_Packet", "timestamp": start + step * idx}
+        for idx in range(count)
+    ]
+
+
+def test_dropped_histogram_is_not_rebuilt_from_an_appended_tail(monkeypatch):
+    # 30 hours of records: only the 60 s histogram fits in 2000 buckets
+    monkeypatch.setattr(summary, "SUMMARY_MAX_BUCKETS", 2000)
+    builder = SummaryBuilder()
+    for record in records(1800, START, timedelta(minutes=1)):
+        builder.add(record)
+    stored = builder.build()
+    assert stored["dropped"] == [1, 5, 10, 30]
+
+    builder = SummaryBuilder.from_summary(stored)
+    tail_start = stored["max_timestamp"] + timedelta(seconds=1)
+    for record in records(600, tail_start, timedelta(milliseconds=100)):
+        builder.add(record)
+    resumed = builder.build()
+
+    assert resumed["records"] == 2400
+    assert list(resumed["histograms"]) == ["60"]
+    assert sum(resumed["histograms"]["60"]["counts"]) == 2400
+    assert resumed["dropped"] == [1, 5, 10, 30]
+
+
+def test_resumed_histogram_counts_every_record():
+    builder = SummaryBuilder()
+    for record in records(120, START, timedelta(seconds=1)):
+        builder.add(record)
+    builder = SummaryBuilder.from_summary(builder.build())
+    for record in records(30, START + timedelta(minutes=2), timedelta(seconds=1)):
+        builder.add(record)
+    resumed = builder.build()
+
+    assert resumed["histograms"]["60"]["counts"] == [60, 60, 30]